@@ -1,24 +1,72 @@
 import asyncio
-import hashlib
 import os
+import shutil
+import tempfile
+import time
 from pathlib import Path
 from typing import Optional
-from urllib.parse import quote_plus
+from urllib.parse import quote_plus, urlsplit, urlunsplit
 
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import (
+    FileResponse,
+    PlainTextResponse,
+    Response,
+    StreamingResponse,
+)
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pyppeteer import launch
 
+from shot_scraper_api.browser import MB, memory_budget, run_watched
+from shot_scraper_api.cache_key import build_key, canonicalize_url, legacy_key
 from shot_scraper_api.config import config
 from shot_scraper_api.console import console
+from shot_scraper_api.content import get_content_store
+from shot_scraper_api.encode import (
+    DEFAULT_FORMAT,
+    DEFAULT_PRESET,
+    MEDIA_TYPES,
+    NEGOTIATED_FORMATS,
+    PRESETS,
+    WEBP_MAX_DIMENSION,
+    accepted_formats,
+    encode,
+    encode_variants,
+    negotiate_format,
+    run_command,
+)
+from shot_scraper_api.failures import get_breaker, get_negative_cache
+from shot_scraper_api.metrics import metrics
+from shot_scraper_api.scheduler import render_scheduler
 
 
 app = FastAPI()
 
 
+async def refresh_bucket_index():
+    """Rescan the bucket often enough that the local index stays fresh"""
+    while True:
+        try:
+            count = await asyncio.to_thread(config.s3_client.rebuild_index)
+            console.log(f"indexed {count} objects in {config.aws_bucket_name}")
+        except Exception as e:
+            console.log(f"Failed to index bucket: {str(e)}")
+        await asyncio.sleep(config.bucket_index_ttl / 2)
+
+
+background_tasks = set()
+
+
+def run_in_background(coro) -> asyncio.Task:
+    """Run coro past the end of the request, holding on to it until it is done"""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize and warm up the browser"""
@@ -26,42 +74,199 @@ async def startup_event():
         console.log("Browser initialized and warmed up")
     except Exception as e:
         console.log(f"Failed to initialize browser: {str(e)}")
+    app.state.refresh_bucket_index = asyncio.create_task(refresh_bucket_index())
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    pass
+    app.state.refresh_bucket_index.cancel()
 
 
-async def take_screenshot(
-    url: str, width: int, height: int, selector_list: list, output: str
+async def take_full_page_screenshot(
+    page, width: int, height: int, scaled_width: int, output: str
 ):
-    """Take a screenshot of a webpage"""
+    """Capture a full page as viewport-height tiles stitched into output
+
+    Each tile is cropped and resized as soon as it is captured, then all of
+    them are appended into output with a single convert. The stitched image
+    is held in memory once, so config.full_page_max_height, where taller
+    pages are cut off, is what bounds memory for a full page shot. The cap
+    is on the output, after scaling, and never above what cwebp can encode.
+    Full page shots keep the page's aspect ratio, there is no scaled height.
+    """
+    page_height = await page.evaluate("() => document.documentElement.scrollHeight")
+    page_height = max(int(page_height), height)
+    max_height = min(config.full_page_max_height, WEBP_MAX_DIMENSION)
+    total_height = min(page_height, max_height * width // scaled_width)
+
+    with tempfile.TemporaryDirectory(prefix="shot-tiles-") as tile_dir:
+        tiles = []
+        offset = 0
+        while offset < total_height:
+            tile_height = min(height, total_height - offset)
+            # the browser will not scroll past the end of the page, so the last
+            # tile is taken from the bottom of the viewport instead
+            scroll_y = min(offset, page_height - height)
+            await page.evaluate(f"() => window.scrollTo(0, {scroll_y})")
+            tile = os.path.join(tile_dir, f"{len(tiles):05d}.png")
+            await page.screenshot({"path": tile, "fullPage": False})
+
+            cmd = [
+                "convert",
+                tile,
+                "-crop",
+                f"{width}x{tile_height}+0+{offset - scroll_y}",
+                "+repage",
+            ]
+            if scaled_width != width:
+                # size each tile from its scaled edges so rounding cannot add
+                # up across tiles and push the output past max_height
+                scaled_top = round(offset * scaled_width / width)
+                scaled_bottom = round((offset + tile_height) * scaled_width / width)
+                cmd.extend(["-resize", f"{scaled_width}x{scaled_bottom - scaled_top}!"])
+            cmd.append(tile)
+            await run_command(cmd)
+            tiles.append(tile)
+            offset += tile_height
+
+        if len(tiles) == 1:
+            os.replace(tiles[0], output)
+        else:
+            await run_command(["convert", *tiles, "-append", output])
+
+
+async def lookup_shot(
+    url: str, key_args: tuple, format: str, full_page: bool, preset: str
+) -> Optional[str]:
+    """Digest of a stored shot, None if there is none
+
+    Shots stored under the md5 key schema are carried over on first use.
+    """
+    content_store = get_content_store()
+    imgname = build_key(url, *key_args, format, full_page, preset)
+    digest = await content_store.lookup(imgname)
+    if digest is None and preset == DEFAULT_PRESET:
+        digest = await content_store.migrate(
+            legacy_key(url, *key_args, format, full_page), imgname
+        )
+    return digest
+
+
+# background variant encodes run outside the render scheduler and memory
+# budget, so they get a small limit of their own
+variant_encodes = asyncio.Semaphore(config.max_variant_encodes)
+
+
+async def store_variants(source: str, workdir: str, variants: dict, preset: str):
+    """Encode and store more formats of a fresh render
+
+    variants maps format to imgname, formats already stored are skipped.
+    workdir, source and all, is removed once they are stored.
+    """
     try:
-        # Launch browser
-        browser = await launch(args=["--no-sandbox"])
-        page = await browser.newPage()
+        content_store = get_content_store()
+        missing = {
+            f: name
+            for f, name in variants.items()
+            if await content_store.lookup(name) is None
+        }
+        if not missing:
+            return
+        outputs = {f: os.path.join(workdir, name) for f, name in missing.items()}
+        async with variant_encodes:
+            with metrics.time("shot_stage_seconds", stage="variants"):
+                encoded = await encode_variants(source, outputs, preset)
+        await asyncio.gather(
+            *(content_store.put(outputs[f], missing[f]) for f in missing if encoded[f])
+        )
+    except Exception as e:
+        console.log(f"Failed to store variants: {str(e)}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
 
-        # Set viewport
-        await page.setViewport({"width": width, "height": height})
 
-        # Navigate to URL
-        await page.goto(url, {"waitUntil": "networkidle0", "timeout": 30000})
+async def render_page(
+    page,
+    url: str,
+    width: int,
+    height: int,
+    selector_list: list,
+    output: str,
+    full_page: bool = False,
+    scaled_width: Optional[int] = None,
+):
+    """Load a page and screenshot it to output"""
+    # Set viewport
+    await page.setViewport({"width": width, "height": height})
+
+    # Navigate to URL
+    await page.goto(url, {"waitUntil": "networkidle0", "timeout": 30000})
 
-        # Wait for selectors if specified
-        for selector in selector_list:
-            try:
-                await page.waitForSelector(selector, {"timeout": 5000})
-            except:
-                console.log(f"Selector {selector} not found")
+    # Wait for selectors if specified
+    for selector in selector_list:
+        try:
+            await page.waitForSelector(selector, {"timeout": 5000})
+        except:
+            console.log(f"Selector {selector} not found")
 
-        # Take screenshot
+    # Take screenshot
+    if full_page:
+        await take_full_page_screenshot(
+            page, width, height, scaled_width or width, output
+        )
+    else:
         await page.screenshot({"path": output, "fullPage": False})
-        await browser.close()
-        return True
-    except Exception as e:
-        console.log(f"Screenshot failed: {str(e)}")
-        return False
+
+
+async def take_screenshot(
+    url: str,
+    width: int,
+    height: int,
+    selector_list: list,
+    output: str,
+    full_page: bool = False,
+    scaled_width: Optional[int] = None,
+):
+    """Take a screenshot of a webpage
+
+    Waits for room in the pod memory budget before launching the browser, and
+    the browser is killed if it goes over the per render memory limit.
+    """
+    queued_at = time.perf_counter()
+    async with memory_budget.reserve(config.render_memory_estimate_mb * MB) as token:
+        metrics.observe(
+            "shot_stage_seconds", time.perf_counter() - queued_at, stage="queue"
+        )
+        browser = None
+        try:
+            with metrics.time("shot_stage_seconds", stage="capture"):
+                # Launch browser
+                browser = await launch(args=["--no-sandbox"])
+                page = await browser.newPage()
+                await run_watched(
+                    browser,
+                    render_page(
+                        page,
+                        url,
+                        width,
+                        height,
+                        selector_list,
+                        output,
+                        full_page=full_page,
+                        scaled_width=scaled_width,
+                    ),
+                    token,
+                )
+            return True
+        except Exception as e:
+            console.log(f"Screenshot failed: {str(e)}")
+            return False
+        finally:
+            if browser is not None:
+                try:
+                    await browser.close()
+                except Exception as e:
+                    console.log(f"Failed to close browser: {str(e)}")
 
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -97,6 +302,35 @@ if config.env == "dev":
 templates.env.filters["quote_plus"] = lambda u: quote_plus(str(u))
 
 
+def client_id(request: Request) -> str:
+    """Who is asking, for fair scheduling across clients behind the ingress
+
+    Clients can send any X-Forwarded-For they like, only the last hop, the
+    address the ingress saw and appended, can be trusted.
+    """
+    forwarded = request.headers.get("x-forwarded-for", "").split(",")[-1].strip()
+    if forwarded:
+        return forwarded
+    return request.client.host if request.client else "unknown"
+
+
+def shot_headers(
+    format: str, digest: Optional[str] = None, negotiated: bool = False
+) -> dict:
+    """Response headers for a shot, the content digest doubles as the ETag"""
+    headers = {
+        "Cache-Control": "public, max-age=86400",
+        "Content-Type": MEDIA_TYPES[format],
+        "Access-Control-Allow-Origin": "*",
+        "Cross-Origin-Resource-Policy": "cross-origin",
+    }
+    if digest is not None:
+        headers["ETag"] = f'"{digest}"'
+    if negotiated:
+        headers["Vary"] = "Accept"
+    return headers
+
+
 @app.get("/")
 def get(request: Request):
     return templates.TemplateResponse(
@@ -114,6 +348,73 @@ async def get_favicon(request: Request):
     return FileResponse(output)
 
 
+def redact_url(url: str) -> str:
+    """A url without credentials, query or fragment, fit for showing others"""
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return ""
+    netloc = parts.netloc.rpartition("@")[2]
+    return urlunsplit((parts.scheme, netloc, parts.path, "", ""))
+
+
+@app.middleware("http")
+async def measure_shots(request: Request, call_next):
+    """Count shot requests by the cache tier that answered them"""
+    if not request.url.path.startswith("/shot") or request.headers.get("hx-request"):
+        return await call_next(request)
+
+    start = time.perf_counter()
+    response = await call_next(request)
+    seconds = time.perf_counter() - start
+    tier = getattr(request.state, "tier", None) or (
+        "error" if response.status_code >= 400 else "other"
+    )
+    metrics.event("shot_requests_total", tier=tier)
+    metrics.observe("shot_request_seconds", seconds, tier=tier)
+    metrics.record_request(
+        redact_url(request.query_params.get("url", "")), seconds, tier
+    )
+    return response
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    metrics.set("shot_render_queue_depth", memory_budget.waiting)
+    metrics.set("shot_host_queue_depth", render_scheduler.waiting)
+    metrics.set("shot_renders_running", memory_budget.running)
+    metrics.set("shot_render_memory_bytes", memory_budget.used)
+    return metrics.render()
+
+
+@app.get("/stats")
+async def get_stats():
+    """Live numbers for the tui dashboard"""
+    requests = metrics.total("shot_requests_total")
+    tiers = metrics.labelled("shot_requests_total")
+    return {
+        "uptime": time.time() - metrics.started_at,
+        "requests": requests,
+        "requests_per_second": metrics.rate("shot_requests_total"),
+        "tiers": {
+            tier: {"count": count, "ratio": count / requests if requests else 0}
+            for tier, count in tiers.items()
+        },
+        "index_lookups": metrics.labelled("shot_index_lookups_total"),
+        "scheduler": render_scheduler.stats(),
+        "renders": {
+            "queued": memory_budget.waiting,
+            "running": memory_budget.running,
+            "memory_used": memory_budget.used,
+            "memory_budget": memory_budget.budget,
+        },
+        "latency": metrics.latency("shot_stage_seconds"),
+        "request_latency": metrics.latency("shot_request_seconds"),
+        "slowest": metrics.slowest(),
+        "circuits": metrics.labelled("shot_circuit_state"),
+    }
+
+
 @app.get(
     "/shot/",
     # responses={200: {"content": {"image/webp": {}, "image/png": {}, "image/jpeg": {}}}},
@@ -133,36 +434,60 @@ async def get_favicon(request: Request):
 async def get_shot(
     request: Request,
     url: str,
-    filename: Optional[str] = "screenshot.webp",
+    filename: Optional[str] = None,
     height: Optional[int] = 450,
     width: Optional[int] = 800,
     scaled_height: Optional[int | str] = None,
     scaled_width: Optional[int | str] = None,
     selectors: Optional[str] = None,
+    full_page: Optional[bool] = False,
+    preset: Optional[str] = None,
 ):
-    # Get format from filename extension
-    ext = filename.split(".")[-1].lower() if "." in filename else "webp"
-    if ext not in ["webp", "png", "jpg", "jpeg"]:
+    # Get format from filename extension, or the Accept header without one
+    negotiated = filename is None or "." not in filename
+    if negotiated:
+        ext = negotiate_format(request.headers.get("accept"))
+    else:
+        ext = filename.split(".")[-1].lower()
+    if ext not in ["avif", "webp", "png", "jpg", "jpeg"]:
         raise HTTPException(
             status_code=400,
-            detail="Invalid format. Must be one of: webp, png, jpg/jpeg",
+            detail="Invalid format. Must be one of: avif, webp, png, jpg/jpeg",
         )
 
     # Normalize jpeg to jpg
     format = "jpg" if ext == "jpeg" else ext
 
+    preset = preset or config.encoder_preset or DEFAULT_PRESET
+    if preset not in PRESETS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid preset. Must be one of: {', '.join(PRESETS)}",
+        )
+
     scaled_height = int(scaled_height) if scaled_height else height
     scaled_width = int(scaled_width) if scaled_width else width
+    if full_page:
+        # full page shots are only scaled by width, so scaled_height would
+        # split the cache without changing the image
+        scaled_height = height
     selector_list = selectors.split(",") if selectors else []
 
-    if not url.startswith("http"):
-        raise HTTPException(status_code=404, detail="url is not a url")
-
     hx_request_header = request.headers.get("hx-request")
-    imgname = (
-        hashlib.md5(f"{url}{''.join(selector_list)}".encode()).hexdigest()
-        + f"-{width}x{height}-{scaled_width}x{scaled_height}.{format}"
-    ).lower()
+    key_args = (
+        width,
+        height,
+        scaled_width,
+        scaled_height,
+        selector_list,
+    )
+    try:
+        target = canonicalize_url(url)
+        imgname = build_key(url, *key_args, format, full_page, preset)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if urlsplit(target).scheme not in ("http", "https"):
+        raise HTTPException(status_code=404, detail="url is not a url")
     print(
         f"height: {height}, width: {width}, scaled_height: {scaled_height}, scaled_width: {scaled_width}, imgname: {imgname}"
     )
@@ -178,129 +503,136 @@ async def get_shot(
                 "scaled_height": scaled_height,
                 "scaled_width": scaled_width,
                 "selectors": selectors,
+                "full_page": full_page,
             },
         )
 
-    output = "/tmp/" + imgname.replace(format, "png")
-    output_final = "/tmp/" + imgname
-
-    if config.s3_client.file_exists(imgname):
-        # print(f"getting presigned url for {imgname} from minio")
-        # imgdata = config.minio_client.get_object(config.bucket_name, imgname)
-        imgdata = await config.s3_client.get_file(imgname)
-        print("streaming from minio")
-
-        return StreamingResponse(
-            imgdata,
-            media_type=f"image/{format}",
-            headers={
-                "Cache-Control": "public, max-age=86400",
-                "Content-Type": f"image/{format}",
-                "Access-Control-Allow-Origin": "*",
-                "Cross-Origin-Resource-Policy": "cross-origin",
-            },
+    content_store = get_content_store()
+    stored_format = format
+    with metrics.time("shot_stage_seconds", stage="lookup"):
+        digest = await lookup_shot(url, key_args, format, full_page, preset)
+        if (
+            digest is None
+            and negotiated
+            and format != DEFAULT_FORMAT
+            and DEFAULT_FORMAT in accepted_formats(request.headers.get("accept"))
+        ):
+            # extension-less shots were always webp before negotiation, answer
+            # with the webp one until this format has been rendered
+            stored_format = DEFAULT_FORMAT
+            digest = await lookup_shot(url, key_args, stored_format, full_page, preset)
+    if digest is not None:
+        headers = shot_headers(stored_format, digest, negotiated)
+        if request.headers.get("if-none-match") == f'"{digest}"':
+            request.state.tier = "http"
+            return Response(status_code=304, headers=headers)
+        with metrics.time("shot_stage_seconds", stage="fetch"):
+            imgdata = await content_store.get(digest)
+        if imgdata is not None:
+            request.state.tier = "store"
+            print("streaming from minio")
+            return StreamingResponse(
+                imgdata, media_type=MEDIA_TYPES[stored_format], headers=headers
+            )
+
+    # Fail fast for shots that just failed and hosts that keep failing
+    negative_cache = get_negative_cache()
+    failure = negative_cache.get(imgname)
+    if failure is not None:
+        request.state.tier = "negative"
+        reason, retry_after = failure
+        raise HTTPException(
+            status_code=503,
+            detail=f"{reason}, not retrying yet",
+            headers={"Retry-After": str(max(1, retry_after))},
         )
 
-        # url = await config.s3_client.get_file_url(imgname)
-        #
-        # # url = "https://minio.wayl.one/shots-dev/8677021b0cb2a77677d6cd1da039623f-800x450-800x450.webp?AWSAccessKeyId=DSg2xoicDrBGbJoLrCuj&Signature=%2F3DVDvDDxL83QKn7erZ%2BfD8%2FIb4%3D&Expires=1737057467"
-        # print(f"got presigned url: {url}")
-        # return RedirectResponse(
-        #     url=url,
-        #     status_code=307,  # Temporary redirect
-        #     headers={
-        #         "Cache-Control": "public, max-age=86400",
-        #         "Content-Type": f"image/{format}",
-        #         "Access-Control-Allow-Origin": "*",
-        #         "Cross-Origin-Resource-Policy": "cross-origin",
-        #     },
-        # )
-
-    # Take screenshot
-    screenshot_success = await take_screenshot(
-        url, width, height, selector_list, output
-    )
-    if not screenshot_success:
-        raise HTTPException(status_code=500, detail="Failed to take screenshot")
-
-    # Resize if needed
-    if Path(output).exists() and (scaled_width != width or scaled_height != height):
-        cmd = [
-            "convert",
-            output,
-            "-resize",
-            f"{scaled_width}x{scaled_height}",
-            output,
-        ]
-        console.log(f"running {cmd}")
-        resize_proc = await asyncio.create_subprocess_exec(
-            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-        )
-        stdout, stderr = await resize_proc.communicate()
-        console.log(stdout.decode())
-        console.log(stderr.decode())
-
-    # Convert to the requested format
-    if format == "webp":
-        cmd = [
-            "cwebp",
-            "-q",
-            "80",
-            output,
-            "-o",
-            output_final,
-        ]
-    elif format == "jpg":
-        cmd = [
-            "convert",
-            output,
-            "-quality",
-            "80",
-            output_final,
-        ]
-    else:  # PNG - just copy the file
-        cmd = ["cp", output, output_final]
-
-    if Path(output).exists():
-        console.log(f"running {cmd}")
-        convert_proc = await asyncio.create_subprocess_exec(
-            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    breaker = get_breaker(urlsplit(target).hostname)
+    if not breaker.allow():
+        request.state.tier = "circuit"
+        raise HTTPException(
+            status_code=503,
+            detail=f"{breaker.host} is failing, not rendering it for now",
+            headers={"Retry-After": str(max(1, breaker.retry_after()))},
         )
-        stdout, stderr = await convert_proc.communicate()
-        console.log(stdout.decode())
-        console.log(stderr.decode())
-
-    if Path(output_final).exists():
-        print("putting", output_final, imgname)
-        await config.s3_client.upload_file(output_final, imgname)
-        # config.minio_client.fput_object(
-        #     config.bucket_name,
-        #     imgname,
-        #     output_final,
-        # )
-
-    imgdata = await config.s3_client.get_file(imgname)
-    print("streaming from minio")
-
-    # url = await config.s3_client.get_file_url(imgname)
-    # print(f"got presigned url: {url}")
-    # return RedirectResponse(
-    #     url=url,
-    #     status_code=307,  # Temporary redirect
-    #     headers={
-    #         "Cache-Control": "public, max-age=86400",
-    #         "Content-Type": f"image/{format}",
-    #         "Access-Control-Allow-Origin": "*",
-    #         "Cross-Origin-Resource-Policy": "cross-origin",
-    #     },
-    # )
-    return StreamingResponse(
+
+    # Render into a directory of our own so identical requests racing each
+    # other never share files
+    workdir = tempfile.mkdtemp(prefix="shot-")
+    output = os.path.join(workdir, "raw.png")
+    background = None
+    try:
+        # Take screenshot, once the host has a free slot and it is our turn
+        try:
+            async with render_scheduler.slot(breaker.host, client_id(request)):
+                screenshot_success = await take_screenshot(
+                    target,
+                    width,
+                    height,
+                    selector_list,
+                    output,
+                    full_page=full_page,
+                    scaled_width=scaled_width,
+                )
+        except asyncio.CancelledError:
+            # the client went away, which says nothing about the host, but a
+            # half open probe must not be left hanging
+            breaker.release_probe()
+            raise
+        if not screenshot_success:
+            breaker.record_failure()
+            negative_cache.add(imgname, "Failed to take screenshot")
+            raise HTTPException(status_code=500, detail="Failed to take screenshot")
+        breaker.record_success()
+
+        # Resize if needed, full page tiles are already resized as they are stitched
+        if (
+            Path(output).exists()
+            and not full_page
+            and (scaled_width != width or scaled_height != height)
+        ):
+            cmd = [
+                "convert",
+                output,
+                "-resize",
+                f"{scaled_width}x{scaled_height}",
+                output,
+            ]
+            with metrics.time("shot_stage_seconds", stage="resize"):
+                await run_command(cmd)
+
+        # Convert to the requested format, the response only waits on that one
+        filepath = os.path.join(workdir, imgname)
+        with metrics.time("shot_stage_seconds", stage="encode"):
+            encoded = await encode(format, preset, output, filepath)
+        if not encoded or not Path(filepath).exists():
+            raise HTTPException(status_code=500, detail="Failed to encode screenshot")
+
+        print("putting", imgname)
+        with metrics.time("shot_stage_seconds", stage="upload"):
+            digest = await content_store.put(filepath, imgname)
+        imgdata = Path(filepath).read_bytes()
+
+        # when the format was negotiated the other negotiable formats are
+        # encoded and stored after the response for the next client
+        if negotiated and config.encode_variants:
+            variants = {
+                f: build_key(url, *key_args, f, full_page, preset)
+                for f in NEGOTIATED_FORMATS
+                if f != format
+            }
+            background = run_in_background(
+                store_variants(output, workdir, variants, preset)
+            )
+    finally:
+        if background is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    request.state.tier = "render"
+    # answer with the file just encoded, the stored copy may already be gone
+    # again and there is no need to read it back from s3
+    return Response(
         content=imgdata,
-        media_type=f"image/{format}",
-        headers={
-            "Cache-Control": "public, max-age=86400",
-            "Content-Type": f"image/{format}",
-            "Access-Control-Allow-Origin": "*",
-            "Cross-Origin-Resource-Policy": "cross-origin",
-        },
+        media_type=MEDIA_TYPES[format],
+        headers=shot_headers(format, digest, negotiated),
     )
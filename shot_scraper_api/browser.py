@@ -0,0 +1,143 @@
+import asyncio
+from contextlib import asynccontextmanager, suppress
+
+import psutil
+
+from shot_scraper_api.config import config
+from shot_scraper_api.console import console
+
+MB = 1024 * 1024
+
+
+class MemoryLimitExceeded(Exception):
+    """A browser went over config.render_memory_limit_mb and was killed"""
+
+
+def process_tree(pid: int) -> list:
+    """The process and all of its children, chromium runs one per tab/gpu/etc"""
+    try:
+        process = psutil.Process(pid)
+        return [process, *process.children(recursive=True)]
+    except psutil.NoSuchProcess:
+        return []
+
+
+def process_tree_rss(pid: int) -> int:
+    """Resident memory of a process tree in bytes"""
+    rss = 0
+    for process in process_tree(pid):
+        try:
+            rss += process.memory_info().rss
+        except psutil.NoSuchProcess:
+            pass
+    return rss
+
+
+def kill_process_tree(pid: int) -> None:
+    for process in reversed(process_tree(pid)):
+        try:
+            process.kill()
+        except psutil.NoSuchProcess:
+            pass
+
+
+class MemoryBudget:
+    """Admit renders against a pod wide memory budget
+
+    Each render reserves config.render_memory_estimate_mb up front, the
+    reservation then tracks the real rss of its browser as the watchdog
+    samples it. New renders wait until the sum of reservations leaves room
+    for them. One render is always admitted so an estimate larger than the
+    budget cannot deadlock.
+    """
+
+    def __init__(self, budget_bytes: int):
+        self.budget = budget_bytes
+        self.usage = {}
+        self.waiting = 0
+        self._condition = None
+
+    @property
+    def condition(self) -> asyncio.Condition:
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    @property
+    def used(self) -> int:
+        return sum(self.usage.values())
+
+    @property
+    def running(self) -> int:
+        return len(self.usage)
+
+    @asynccontextmanager
+    async def reserve(self, estimate: int):
+        token = object()
+        async with self.condition:
+            self.waiting += 1
+            try:
+                await self.condition.wait_for(
+                    lambda: not self.usage or self.used + estimate <= self.budget
+                )
+            finally:
+                self.waiting -= 1
+            self.usage[token] = estimate
+        try:
+            yield token
+        finally:
+            async with self.condition:
+                del self.usage[token]
+                self.condition.notify_all()
+
+    def update(self, token, rss: int, estimate: int) -> None:
+        """Grow or shrink a reservation to what the browser is really using"""
+        if token in self.usage:
+            self.usage[token] = max(rss, estimate)
+
+
+memory_budget = MemoryBudget(config.render_memory_budget_mb * MB)
+
+
+async def watch_memory(pid: int, token) -> None:
+    """Sample a browser's process tree until it goes over the per render cap
+
+    Only returns after the browser has been killed for using too much memory,
+    callers race it against the render.
+    """
+    limit = config.render_memory_limit_mb * MB
+    estimate = config.render_memory_estimate_mb * MB
+    while True:
+        rss = await asyncio.to_thread(process_tree_rss, pid)
+        memory_budget.update(token, rss, estimate)
+        if rss > limit:
+            console.log(
+                f"browser {pid} using {rss // MB}mb, over the {limit // MB}mb limit, killing it"
+            )
+            await asyncio.to_thread(kill_process_tree, pid)
+            return
+        await asyncio.sleep(config.render_memory_sample_interval)
+
+
+async def run_watched(browser, render, token):
+    """Run a render coroutine, killing its browser if it uses too much memory
+
+    Raises MemoryLimitExceeded if the watchdog had to kill the browser.
+    """
+    render_task = asyncio.ensure_future(render)
+    watchdog = asyncio.ensure_future(watch_memory(browser.process.pid, token))
+    try:
+        done, _ = await asyncio.wait(
+            {render_task, watchdog}, return_when=asyncio.FIRST_COMPLETED
+        )
+        if render_task in done:
+            return render_task.result()
+        raise MemoryLimitExceeded(f"render went over {config.render_memory_limit_mb}mb")
+    finally:
+        watchdog.cancel()
+        render_task.cancel()
+        # let the render unwind before the caller closes its browser, a killed
+        # browser fails it with whatever pyppeteer raises
+        for task in (render_task, watchdog):
+            with suppress(asyncio.CancelledError, Exception):
+                await task
@@ -0,0 +1,190 @@
+import sqlite3
+import time
+from functools import lru_cache
+from pathlib import Path
+
+from shot_scraper_api.config import config
+
+# every replica uploads content and index objects, one of these missing from
+# this pod's index may well have just been written by another pod
+SHARED_PREFIXES = ("content/", "index/")
+
+
+class BucketIndex:
+    """Local sqlite index of the objects in the bucket
+
+    Built from a full paginated scan and kept current by S3Client on upload,
+    delete and read. Within config.bucket_index_ttl seconds of the last scan
+    a key outside SHARED_PREFIXES that is missing from the index is trusted
+    to be missing from the bucket, so misses on old keys are answered without
+    a round trip. last_access, which only this machine's reads update, orders
+    cache gc.
+
+    That only takes the legacy md5 key checks off the miss path. Misses on
+    current keys still go to s3: a /shot miss GETs index/<imgname>, again for
+    the webp fallback of a negotiated request, and HEADs content/<digest>
+    after rendering. Trusting those would take an index shared by all the
+    replicas.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        path = Path(config.cache_dir) / "bucket_index.sqlite"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS objects (
+                key TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                etag TEXT,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """)
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS objects_last_access ON objects (last_access)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value REAL)"
+        )
+
+    def rebuild(self, objects) -> int:
+        """Replace the index with the objects from a full bucket scan
+
+        objects is an iterable of list_objects_v2 entries. last_access is kept
+        for keys that were already indexed, new keys start at their upload
+        time. Keys added or read while the scan was paging through the bucket
+        are kept even though the scan missed them. Returns the number of keys.
+        """
+        scanned_at = time.time()
+        self.conn.execute("BEGIN")
+        try:
+            self.conn.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS scan (key TEXT PRIMARY KEY, size INTEGER, etag TEXT, created REAL)"
+            )
+            self.conn.execute("DELETE FROM scan")
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO scan VALUES (?, ?, ?, ?)",
+                (
+                    (
+                        obj["Key"],
+                        obj["Size"],
+                        obj.get("ETag"),
+                        obj["LastModified"].timestamp(),
+                    )
+                    for obj in objects
+                ),
+            )
+            self.conn.execute(
+                """
+                DELETE FROM objects
+                WHERE key NOT IN (SELECT key FROM scan)
+                AND created < ? AND last_access < ?
+                """,
+                (scanned_at, scanned_at),
+            )
+            self.conn.execute("""
+                INSERT INTO objects (key, size, etag, created, last_access)
+                SELECT key, size, etag, created, created FROM scan WHERE true
+                ON CONFLICT (key) DO UPDATE SET
+                    size = excluded.size,
+                    etag = excluded.etag,
+                    created = excluded.created
+                """)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('scanned_at', ?)", (scanned_at,)
+            )
+            count = self.conn.execute("SELECT count(*) FROM scan").fetchone()[0]
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return count
+
+    def scanned_at(self) -> float | None:
+        row = self.conn.execute(
+            "SELECT value FROM meta WHERE name = 'scanned_at'"
+        ).fetchone()
+        return row[0] if row else None
+
+    def is_fresh(self) -> bool:
+        scanned_at = self.scanned_at()
+        return (
+            scanned_at is not None
+            and time.time() - scanned_at < self.config.bucket_index_ttl
+        )
+
+    def add(self, key: str, size: int, etag: str | None = None, created=None):
+        now = time.time()
+        created = created or now
+        self.conn.execute(
+            """
+            INSERT INTO objects (key, size, etag, created, last_access)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET
+                size = excluded.size,
+                etag = excluded.etag,
+                created = excluded.created,
+                last_access = excluded.last_access
+            """,
+            (key, size, etag, created, now),
+        )
+
+    def remove(self, key: str):
+        self.conn.execute("DELETE FROM objects WHERE key = ?", (key,))
+
+    def touch(self, key: str):
+        self.conn.execute(
+            "UPDATE objects SET last_access = ? WHERE key = ?", (time.time(), key)
+        )
+
+    def contains(self, key: str) -> bool:
+        return (
+            self.conn.execute("SELECT 1 FROM objects WHERE key = ?", (key,)).fetchone()
+            is not None
+        )
+
+    def known_absent(self, key: str) -> bool:
+        """True if a fresh scan says key is not in the bucket
+
+        Never true for SHARED_PREFIXES, other replicas write those.
+        """
+        return (
+            not key.startswith(SHARED_PREFIXES)
+            and self.is_fresh()
+            and not self.contains(key)
+        )
+
+    def total_bytes(self) -> int:
+        row = self.conn.execute("SELECT coalesce(sum(size), 0) FROM objects").fetchone()
+        return row[0]
+
+    def least_recently_used_locally(self, prefix: str = "") -> list:
+        """(key, size) pairs, least recently read on this machine first
+
+        Keys this machine has never read are ordered by their upload time.
+        """
+        return self.conn.execute(
+            "SELECT key, size FROM objects WHERE substr(key, 1, ?) = ? ORDER BY last_access",
+            (len(prefix), prefix),
+        ).fetchall()
+
+    def stats(self) -> dict:
+        count, size = self.conn.execute(
+            "SELECT count(*), coalesce(sum(size), 0) FROM objects"
+        ).fetchone()
+        return {
+            "keys": count,
+            "bytes": size,
+            "scanned_at": self.scanned_at(),
+            "fresh": self.is_fresh(),
+        }
+
+
+@lru_cache()
+def get_bucket_index() -> BucketIndex:
+    """Get cached bucket index instance."""
+    return BucketIndex(config)
@@ -0,0 +1,113 @@
+import hashlib
+import json
+from fnmatch import fnmatch
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from shot_scraper_api.config import config
+from shot_scraper_api.encode import DEFAULT_PRESET
+
+# bump when the layout of the hashed spec changes, keys from older schemas
+# are migrated lazily by get_shot through legacy_key
+KEY_SCHEMA_VERSION = 2
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def is_tracking_param(name: str, tracking_params: list) -> bool:
+    """Check a query param name against exact names or globs like utm_*"""
+    name = name.lower()
+    return any(fnmatch(name, pattern.lower()) for pattern in tracking_params)
+
+
+def canonicalize_url(url: str, tracking_params: list | None = None) -> str:
+    """Normalize a url so equivalent urls share one cache key
+
+    Lowercases the scheme and host, drops default ports, the fragment and
+    tracking params, and sorts the remaining query params. Raises ValueError
+    for urls without a host or with a port that is out of range.
+    """
+    if tracking_params is None:
+        tracking_params = config.tracking_params
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    if not parts.hostname:
+        raise ValueError(f"url has no host: {url}")
+    try:
+        port = parts.port
+    except ValueError:
+        raise ValueError(f"url has an invalid port: {url}") from None
+
+    netloc = parts.hostname.lower()
+    if ":" in netloc:
+        # ipv6 literal
+        netloc = f"[{netloc}]"
+    if port and port != DEFAULT_PORTS.get(scheme):
+        netloc = f"{netloc}:{port}"
+    if parts.username:
+        userinfo = parts.username
+        if parts.password:
+            userinfo = f"{userinfo}:{parts.password}"
+        netloc = f"{userinfo}@{netloc}"
+
+    query = sorted(
+        (name, value)
+        for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not is_tracking_param(name, tracking_params)
+    )
+
+    return urlunsplit((scheme, netloc, parts.path or "/", urlencode(query), ""))
+
+
+def build_key(
+    url: str,
+    width: int,
+    height: int,
+    scaled_width: int,
+    scaled_height: int,
+    selector_list: list,
+    format: str,
+    full_page: bool = False,
+    preset: str = DEFAULT_PRESET,
+) -> str:
+    """Build the storage key for a shot
+
+    The url and selectors are hashed as json so selector boundaries are
+    unambiguous, selectors are sorted so their order does not matter.
+    Encoder presets other than the default get their own suffix.
+    """
+    spec = json.dumps(
+        {
+            "v": KEY_SCHEMA_VERSION,
+            "url": canonicalize_url(url),
+            "selectors": sorted({s.strip() for s in selector_list if s.strip()}),
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    digest = hashlib.sha256(spec.encode()).hexdigest()[:32]
+    return (
+        f"v{KEY_SCHEMA_VERSION}-{digest}"
+        + f"-{width}x{height}-{scaled_width}x{scaled_height}"
+        + ("-full" if full_page else "")
+        + (f"-{preset}" if preset != DEFAULT_PRESET else "")
+        + f".{format}"
+    )
+
+
+def legacy_key(
+    url: str,
+    width: int,
+    height: int,
+    scaled_width: int,
+    scaled_height: int,
+    selector_list: list,
+    format: str,
+    full_page: bool = False,
+) -> str:
+    """The schema 1 key, md5 of the raw url and joined selectors"""
+    return (
+        hashlib.md5(f"{url}{''.join(selector_list)}".encode()).hexdigest()
+        + f"-{width}x{height}-{scaled_width}x{scaled_height}"
+        + ("-full" if full_page else "")
+        + f".{format}"
+    ).lower()
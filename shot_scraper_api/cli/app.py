@@ -2,17 +2,18 @@ import typer
 
 from shot_scraper_api.cli.common import verbose_callback
 from shot_scraper_api.cli.config import config_app
-
-# from shot_scraper_api.cli.tui import tui_app
+from shot_scraper_api.cli.tui import tui_app
 from shot_scraper_api.cli.api import api_app
+from shot_scraper_api.cli.cache import cache_app
 
 app = typer.Typer(
     name="shot_scraper_api",
     help="A rich terminal report for coveragepy.",
 )
 app.add_typer(config_app, name="config")
-# app.add_typer(tui_app)
+app.add_typer(tui_app, name="tui")
 app.add_typer(api_app, name="api")
+app.add_typer(cache_app, name="cache")
 
 
 def version_callback(value: bool) -> None:
@@ -0,0 +1,141 @@
+from rich.console import Console
+from rich.table import Table
+import typer
+
+from shot_scraper_api.cli.common import verbose_callback
+
+cache_app = typer.Typer()
+
+
+@cache_app.callback()
+def cache(
+    verbose: bool = typer.Option(
+        False,
+        callback=verbose_callback,
+        help="show the log messages",
+    ),
+):
+    "shot cache cli"
+
+
+@cache_app.command()
+def stats(
+    verbose: bool = typer.Option(
+        False,
+        callback=verbose_callback,
+        help="show the log messages",
+    ),
+):
+    "report how much content addressed storage is deduplicating"
+    from shot_scraper_api.content import get_content_store
+
+    report = get_content_store().stats()
+
+    table = Table(title="content store")
+    table.add_column("stat")
+    table.add_column("value", justify="right")
+    table.add_row("keys", str(report["keys"]))
+    table.add_row("stored objects", str(report["objects"]))
+    table.add_row("dedupe hits", str(report["dedupe_hits"]))
+    table.add_row("logical bytes", f"{report['logical_bytes']:,}")
+    table.add_row("stored bytes", f"{report['stored_bytes']:,}")
+    table.add_row("bytes saved", f"{report['bytes_saved']:,}")
+    table.add_row("dedupe ratio", f"{report['dedupe_ratio']:.2f}x")
+    Console().print(table)
+
+
+@cache_app.command()
+def key(
+    url: str = typer.Argument(..., help="url of the page to shoot"),
+    width: int = typer.Option(800, help="viewport width"),
+    height: int = typer.Option(450, help="viewport height"),
+    scaled_width: int = typer.Option(None, help="output width"),
+    scaled_height: int = typer.Option(None, help="output height"),
+    selectors: str = typer.Option(None, help="comma separated selectors"),
+    format: str = typer.Option("webp", help="avif, webp, png or jpg"),
+    full_page: bool = typer.Option(False, help="capture the full page"),
+    preset: str = typer.Option(
+        None, help="fast, balanced or smallest, defaults to the configured preset"
+    ),
+    explain: bool = typer.Option(
+        False, help="also print the canonical url and the old md5 key"
+    ),
+):
+    "print the cache key for a shot spec"
+    from shot_scraper_api.cache_key import build_key, canonicalize_url, legacy_key
+    from shot_scraper_api.config import config
+    from shot_scraper_api.encode import DEFAULT_PRESET, MEDIA_TYPES, PRESETS
+
+    format = "jpg" if format == "jpeg" else format
+    if format not in MEDIA_TYPES:
+        raise typer.BadParameter(
+            f"must be one of: {', '.join(MEDIA_TYPES)}", param_hint="--format"
+        )
+    preset = preset or config.encoder_preset or DEFAULT_PRESET
+    if preset not in PRESETS:
+        raise typer.BadParameter(
+            f"must be one of: {', '.join(PRESETS)}", param_hint="--preset"
+        )
+    key_args = (
+        width,
+        height,
+        scaled_width or width,
+        scaled_height or height,
+        selectors.split(",") if selectors else [],
+        format,
+        full_page,
+    )
+    try:
+        typer.echo(build_key(url, *key_args, preset=preset))
+    except ValueError as e:
+        raise typer.BadParameter(str(e), param_hint="URL")
+    if explain:
+        typer.echo(f"canonical url: {canonicalize_url(url)}")
+        typer.echo(f"legacy key: {legacy_key(url, *key_args)}")
+
+
+@cache_app.command()
+def index(
+    verbose: bool = typer.Option(
+        False,
+        callback=verbose_callback,
+        help="show the log messages",
+    ),
+):
+    "rebuild the local index of bucket contents"
+    from shot_scraper_api.config import config
+
+    s3_client = config.s3_client
+    count = s3_client.rebuild_index()
+    Console().print(f"indexed {count} objects")
+    Console().print(s3_client.index.stats())
+
+
+@cache_app.command()
+def gc(
+    budget_mb: int = typer.Option(..., help="size to shrink the bucket to"),
+    rescan: bool = typer.Option(True, help="rebuild the index before collecting"),
+    dry_run: bool = typer.Option(False, help="only print what would be deleted"),
+):
+    """delete shots until the bucket is under budget
+
+    shots go in order of when this machine last read them, or of when they
+    were uploaded if it never has, reads on other replicas are not seen
+    """
+    import asyncio
+
+    from shot_scraper_api.config import config
+    from shot_scraper_api.content import get_content_store
+
+    if rescan:
+        config.s3_client.rebuild_index()
+    deleted = asyncio.run(
+        get_content_store().gc(budget_mb * 1024 * 1024, dry_run=dry_run)
+    )
+
+    console = Console()
+    for key, size in deleted:
+        console.print(f"{'would delete' if dry_run else 'deleted'} {key} {size:,}")
+    console.print(
+        f"{len(deleted)} objects, {sum(size for _, size in deleted):,} bytes freed"
+    )
@@ -1,18 +1,26 @@
-# import typer
-#
-# from shot_scraper_api.cli.common import verbose_callback
-# from shot_scraper_api.tui.app import run_app
-#
-# tui_app = typer.Typer()
-#
-#
-# @tui_app.callback(invoke_without_command=True)
-# def i(
-#     verbose: bool = typer.Option(
-#         False,
-#         callback=verbose_callback,
-#         help="show the log messages",
-#     ),
-# ):
-#     "interactive tui"
-#     run_app()
+import typer
+
+from shot_scraper_api.cli.common import verbose_callback
+from shot_scraper_api.tui.app import run_app
+
+tui_app = typer.Typer()
+
+
+@tui_app.callback(invoke_without_command=True)
+def tui(
+    url: str = typer.Option(
+        None,
+        help="base url of the running api, defaults to TUI_API_URL",
+    ),
+    refresh: float = typer.Option(
+        None,
+        help="seconds between refreshes, defaults to TUI_REFRESH_INTERVAL",
+    ),
+    verbose: bool = typer.Option(
+        False,
+        callback=verbose_callback,
+        help="show the log messages",
+    ),
+):
+    "live operations dashboard for a running api"
+    run_app(api_url=url, refresh_interval=refresh)
@@ -19,6 +19,38 @@ class Config(BaseSettings):
     docker_repo: Optional[str] = Field(None)
     max_file_size_mb: Optional[int] = Field(100)
     cache_dir: Optional[str] = Field("/cache/")
+    full_page_max_height: Optional[int] = Field(16000)
+    encoder_preset: Optional[str] = Field("balanced")
+    encode_variants: Optional[bool] = Field(True)
+    max_variant_encodes: Optional[int] = Field(2)
+    render_memory_limit_mb: Optional[int] = Field(1024)
+    render_memory_estimate_mb: Optional[int] = Field(300)
+    render_memory_budget_mb: Optional[int] = Field(3072)
+    render_memory_sample_interval: Optional[float] = Field(0.25)
+    max_concurrent_renders: Optional[int] = Field(8)
+    max_renders_per_host: Optional[int] = Field(2)
+    scheduler_fair_by: Optional[str] = Field("host")
+    negative_cache_ttl: Optional[int] = Field(60)
+    circuit_failure_threshold: Optional[int] = Field(5)
+    circuit_reset_timeout: Optional[int] = Field(30)
+    circuit_max_hosts: Optional[int] = Field(1000)
+    tui_api_url: Optional[str] = Field("http://localhost:5000")
+    tui_refresh_interval: Optional[float] = Field(2.0)
+    bucket_index_ttl: Optional[int] = Field(600)
+    tracking_params: Optional[list[str]] = Field(
+        [
+            "utm_*",
+            "fbclid",
+            "gclid",
+            "dclid",
+            "msclkid",
+            "mc_cid",
+            "mc_eid",
+            "igshid",
+            "_ga",
+            "ref_src",
+        ]
+    )
 
     class Config:
         env_file = ".env"
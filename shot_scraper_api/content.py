@@ -0,0 +1,208 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+
+from diskcache import Cache
+
+from shot_scraper_api.config import config
+from shot_scraper_api.metrics import metrics
+
+
+class ContentStore:
+    """Content addressed storage for rendered shots
+
+    Encoded images are stored once in the bucket under content/<sha256>, no
+    matter how many imgname keys render to the same bytes. Each imgname points
+    at its content through a small index object, index/<imgname>, whose body
+    is the digest. The index and the set of known digests are memoized in a
+    local diskcache so repeat lookups do not go to s3.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.s3_client = config.s3_client
+        self.cache = Cache(Path(config.cache_dir) / "content")
+
+    @staticmethod
+    def content_key(digest: str) -> str:
+        return f"content/{digest}"
+
+    @staticmethod
+    def index_key(imgname: str) -> str:
+        return f"index/{imgname}"
+
+    @staticmethod
+    def hash_file(filepath: str) -> str:
+        """sha256 of a file, read in chunks"""
+        sha = hashlib.sha256()
+        with open(filepath, "rb") as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    async def lookup(self, imgname: str) -> str | None:
+        """Get the content digest for an imgname, None if it was never stored"""
+        digest = self.cache.get(f"key:{imgname}")
+        if digest is not None:
+            metrics.incr("shot_index_lookups_total", tier="local")
+            return digest
+
+        body = await asyncio.to_thread(
+            self.s3_client.read_bytes, self.index_key(imgname)
+        )
+        if body is None:
+            metrics.incr("shot_index_lookups_total", tier="miss")
+            return None
+        metrics.incr("shot_index_lookups_total", tier="s3")
+        digest = body.decode()
+        self.cache.set(f"key:{imgname}", digest)
+        return digest
+
+    async def content_exists(self, digest: str) -> bool:
+        return await asyncio.to_thread(
+            self.s3_client.file_exists, self.content_key(digest)
+        )
+
+    async def put(self, filepath: str, imgname: str) -> str:
+        """Store a rendered file under its digest and point imgname at it
+
+        The content is only uploaded if no other key has stored the same
+        bytes yet. Returns the digest.
+        """
+        digest = await asyncio.to_thread(self.hash_file, filepath)
+        size = Path(filepath).stat().st_size
+
+        if not await self.content_exists(digest):
+            await self.s3_client.upload_file(filepath, self.content_key(digest))
+        self.cache.set(f"content:{digest}", size)
+
+        await self.link(imgname, digest)
+        return digest
+
+    async def link(self, imgname: str, digest: str) -> None:
+        """Point imgname at already stored content
+
+        The dedupe stats count what the linked keys reference. The first key
+        on a digest counts it as a stored object, every further key is a
+        dedupe hit. Relinking an imgname to the digest it already has, as
+        re-renders and repeat uploads do, is not counted again.
+        """
+        await self.s3_client.upload_bytes(self.index_key(imgname), digest.encode())
+        self.cache.set(f"key:{imgname}", digest)
+        previous = self.cache.get(f"linked:{imgname}")
+        if previous == digest:
+            return
+        self.cache.set(f"linked:{imgname}", digest)
+        if previous is None:
+            self.cache.incr("stats:keys")
+        else:
+            self._unref(previous)
+
+        size = self.cache.get(f"content:{digest}", 0)
+        self.cache.incr("stats:logical_bytes", size)
+        if self.cache.incr(f"refs:{digest}") == 1:
+            self.cache.incr("stats:objects")
+            self.cache.incr("stats:stored_bytes", size)
+        else:
+            self.cache.incr("stats:dedupe_hits")
+            self.cache.incr("stats:bytes_saved", size)
+
+    def _unref(self, digest: str) -> None:
+        """Take one linked key off digest in the stats"""
+        size = self.cache.get(f"content:{digest}", 0)
+        self.cache.decr("stats:logical_bytes", size)
+        if self.cache.decr(f"refs:{digest}") <= 0:
+            self.cache.delete(f"refs:{digest}")
+            self.cache.decr("stats:objects")
+            self.cache.decr("stats:stored_bytes", size)
+        else:
+            self.cache.decr("stats:dedupe_hits")
+            self.cache.decr("stats:bytes_saved", size)
+
+    async def migrate(self, old_imgname: str, imgname: str) -> str | None:
+        """Carry a shot stored under an older key schema over to imgname
+
+        Old keys are plain objects at the bucket root from before content
+        addressing, they get hashed and stored. Returns the digest, None if
+        there was nothing under old_imgname.
+        """
+        if not await asyncio.to_thread(self.s3_client.file_exists, old_imgname):
+            return None
+        with tempfile.TemporaryDirectory(prefix="shot-migrate-") as workdir:
+            filepath = os.path.join(workdir, old_imgname)
+            await self.s3_client.download_file(old_imgname, filepath)
+            return await self.put(filepath, imgname)
+
+    async def get(self, digest: str):
+        """Stream stored content by digest, None if it has been collected"""
+        try:
+            return await self.s3_client.get_file(self.content_key(digest))
+        except FileNotFoundError:
+            # gc on another machine removed the content, keys pointing at it
+            # re-render and upload the same bytes again
+            return None
+
+    async def gc(self, budget_bytes: int, dry_run: bool = False) -> list:
+        """Collect stored content until the bucket fits budget_bytes
+
+        Runs S3Client.gc and takes the collected content back out of the
+        dedupe stats. Returns the deleted (key, size) pairs.
+        """
+        deleted = await self.s3_client.gc(budget_bytes, dry_run=dry_run)
+        if not dry_run:
+            self.forget(
+                {
+                    key.removeprefix("content/"): size
+                    for key, size in deleted
+                    if key.startswith("content/")
+                }
+            )
+        return deleted
+
+    def forget(self, collected: dict) -> None:
+        """Drop collected content, digest to size, from the stats
+
+        Keys pointing at it stop counting until they are rendered and linked
+        again.
+        """
+        for name in list(self.cache.iterkeys()):
+            if not name.startswith("linked:"):
+                continue
+            digest = self.cache.get(name)
+            if digest in collected:
+                imgname = name.removeprefix("linked:")
+                self._unref(digest)
+                self.cache.delete(name)
+                self.cache.delete(f"key:{imgname}")
+                self.cache.decr("stats:keys")
+        for digest in collected:
+            self.cache.delete(f"content:{digest}")
+
+    def stats(self) -> dict:
+        """Dedupe report for the keys this store has linked"""
+        stats = {
+            name: self.cache.get(f"stats:{name}", 0)
+            for name in [
+                "keys",
+                "objects",
+                "dedupe_hits",
+                "logical_bytes",
+                "stored_bytes",
+                "bytes_saved",
+            ]
+        }
+        stats["dedupe_ratio"] = (
+            stats["logical_bytes"] / stats["stored_bytes"]
+            if stats["stored_bytes"]
+            else 1.0
+        )
+        return stats
+
+
+@lru_cache()
+def get_content_store() -> ContentStore:
+    """Get cached content store instance."""
+    return ContentStore(config)
@@ -0,0 +1,131 @@
+import asyncio
+
+from shot_scraper_api.console import console
+
+MEDIA_TYPES = {
+    "avif": "image/avif",
+    "webp": "image/webp",
+    "jpg": "image/jpeg",
+    "png": "image/png",
+}
+
+# formats tried when the client lets us choose, smallest first
+NEGOTIATED_FORMATS = ["avif", "webp", "jpg"]
+
+DEFAULT_FORMAT = "webp"
+DEFAULT_PRESET = "balanced"
+
+# cwebp refuses images taller or wider than this
+WEBP_MAX_DIMENSION = 16383
+
+# encoder arguments per preset, fast trades bytes for cpu time and smallest
+# the other way round, balanced matches what was hard coded before presets
+PRESETS = {
+    "fast": {
+        "avif": ["--speed", "10", "--min", "20", "--max", "30"],
+        "webp": ["-q", "80", "-m", "1"],
+        "jpg": ["-quality", "80"],
+        "png": ["-o1"],
+    },
+    "balanced": {
+        "avif": ["--speed", "6", "--min", "18", "--max", "28"],
+        "webp": ["-q", "80", "-m", "4"],
+        "jpg": ["-quality", "80", "-strip", "-interlace", "Plane"],
+        "png": ["-o2"],
+    },
+    "smallest": {
+        "avif": ["--speed", "2", "--min", "22", "--max", "32"],
+        "webp": ["-q", "75", "-m", "6", "-af"],
+        "jpg": [
+            "-quality",
+            "72",
+            "-strip",
+            "-interlace",
+            "Plane",
+            "-sampling-factor",
+            "4:2:0",
+        ],
+        "png": ["-o5", "-strip", "all"],
+    },
+}
+
+
+def accepted_formats(accept: str | None) -> list:
+    """The formats the Accept header allows, smallest first
+
+    avif has to be asked for by name, wildcards allow the rest. Types refused
+    with q=0 are never allowed through a wildcard.
+    """
+    accepted = set()
+    refused = set()
+    for part in (accept or "").split(","):
+        media_type, *params = part.strip().split(";")
+        quality = 1.0
+        for param in params:
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.add(media_type.strip().lower())
+        else:
+            refused.add(media_type.strip().lower())
+
+    wildcard = not accepted or bool(accepted & {"image/*", "*/*"})
+    formats = ["avif"] if "image/avif" in accepted else []
+    for format in ["webp", "jpg", "png"]:
+        media_type = MEDIA_TYPES[format]
+        if media_type in accepted or (wildcard and media_type not in refused):
+            formats.append(format)
+    return formats
+
+
+def negotiate_format(accept: str | None) -> str:
+    """Pick the smallest format the Accept header allows
+
+    Wildcards get webp like requests without an extension always have, the
+    next smallest format when webp is refused.
+    """
+    formats = accepted_formats(accept)
+    return formats[0] if formats else DEFAULT_FORMAT
+
+
+def encode_command(format: str, preset: str, source: str, output: str) -> list:
+    """The command that encodes a raw png screenshot to format"""
+    args = PRESETS[preset][format]
+    if format == "avif":
+        return ["avifenc", *args, source, output]
+    if format == "webp":
+        return ["cwebp", *args, source, "-o", output]
+    if format == "jpg":
+        return ["convert", source, *args, output]
+    return ["optipng", "-quiet", "-clobber", *args, source, "-out", output]
+
+
+async def run_command(cmd: list) -> bool:
+    """Run an external image tool, logging its output"""
+    console.log(f"running {cmd}")
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await proc.communicate()
+    console.log(stdout.decode())
+    console.log(stderr.decode())
+    return proc.returncode == 0
+
+
+async def encode(format: str, preset: str, source: str, output: str) -> bool:
+    return await run_command(encode_command(format, preset, source, output))
+
+
+async def encode_variants(source: str, outputs: dict, preset: str) -> dict:
+    """Encode one screenshot to several formats at once
+
+    outputs maps format to output path, returns format to success.
+    """
+    results = await asyncio.gather(
+        *(encode(format, preset, source, output) for format, output in outputs.items())
+    )
+    return dict(zip(outputs, results))
@@ -0,0 +1,166 @@
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+
+from diskcache import Cache
+
+from shot_scraper_api.config import config
+from shot_scraper_api.console import console
+from shot_scraper_api.metrics import metrics
+
+metrics.describe(
+    "shot_circuit_state", "target hosts whose breaker is 1 half open or 2 open"
+)
+metrics.describe("shot_circuit_opened_total", "times a host breaker has opened")
+metrics.describe(
+    "shot_circuit_rejected_total", "renders refused because a breaker was open"
+)
+metrics.describe(
+    "shot_negative_cache_hits_total", "requests answered from a cached failure"
+)
+
+
+class NegativeCache:
+    """Remember failed renders for config.negative_cache_ttl seconds
+
+    Keyed by imgname, so a repeat request for a shot that just timed out
+    fails immediately instead of tying up a browser for another 30s.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.cache = Cache(Path(config.cache_dir) / "negative")
+
+    def add(self, imgname: str, reason: str) -> None:
+        self.cache.set(imgname, reason, expire=self.config.negative_cache_ttl)
+
+    def get(self, imgname: str) -> tuple | None:
+        """(reason, seconds until it expires) for a cached failure, or None"""
+        reason, expire_time = self.cache.get(imgname, expire_time=True)
+        if reason is None:
+            return None
+        metrics.incr("shot_negative_cache_hits_total")
+        return reason, max(0, int((expire_time or time.time()) - time.time()))
+
+
+class CircuitBreaker:
+    """Stop rendering a target host after repeated failures
+
+    Opens after config.circuit_failure_threshold failures in a row. Once
+    config.circuit_reset_timeout seconds have passed it half opens and lets a
+    single probe render through, which closes it again on success or re-opens
+    it on failure.
+    """
+
+    CLOSED = "closed"
+    HALF_OPEN = "half_open"
+    OPEN = "open"
+    STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, host: str, config):
+        self.host = host
+        self.config = config
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.last_used = time.time()
+        self._report()
+
+    def _report(self) -> None:
+        # hosts are picked by whoever calls the api, only the few that are
+        # failing get a series
+        if self.state == self.CLOSED:
+            metrics.unset("shot_circuit_state", host=self.host)
+        else:
+            metrics.set(
+                "shot_circuit_state", self.STATE_VALUES[self.state], host=self.host
+            )
+
+    def _transition(self, state: str) -> None:
+        if state != self.state:
+            console.log(f"circuit for {self.host} {self.state} -> {state}")
+        self.state = state
+        self._report()
+
+    def retry_after(self) -> int:
+        """Seconds until an open breaker will half open"""
+        return max(
+            0, int(self.opened_at + self.config.circuit_reset_timeout - time.time())
+        )
+
+    def allow(self) -> bool:
+        """Whether a render for this host may start now"""
+        if self.state == self.OPEN and self.retry_after() == 0:
+            self._transition(self.HALF_OPEN)
+            self.probing = False
+        if self.state == self.HALF_OPEN:
+            if self.probing:
+                allowed = False
+            else:
+                self.probing = True
+                allowed = True
+        else:
+            allowed = self.state == self.CLOSED
+        if not allowed:
+            metrics.incr("shot_circuit_rejected_total")
+        return allowed
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.probing = False
+        self._transition(self.CLOSED)
+
+    def release_probe(self) -> None:
+        """Give up a probe without a verdict, so the next request can probe"""
+        self.probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.probing = False
+        if (
+            self.state == self.HALF_OPEN
+            or self.failures >= self.config.circuit_failure_threshold
+        ):
+            self.opened_at = time.time()
+            metrics.incr("shot_circuit_opened_total")
+            self._transition(self.OPEN)
+
+
+# least recently used first
+breakers = OrderedDict()
+
+
+def prune_breakers() -> None:
+    """Forget breakers that have nothing to remember
+
+    Closed breakers that have not been used for config.circuit_reset_timeout
+    seconds go, and past config.circuit_max_hosts the least recently used
+    ones go whatever their state.
+    """
+    idle_since = time.time() - config.circuit_reset_timeout
+    for host, breaker in list(breakers.items()):
+        if breaker.last_used >= idle_since:
+            break
+        if breaker.state == CircuitBreaker.CLOSED:
+            del breakers[host]
+    while len(breakers) > config.circuit_max_hosts:
+        host, _ = breakers.popitem(last=False)
+        metrics.unset("shot_circuit_state", host=host)
+
+
+def get_breaker(host: str) -> CircuitBreaker:
+    breaker = breakers.get(host)
+    if breaker is None:
+        breaker = breakers[host] = CircuitBreaker(host, config)
+        prune_breakers()
+    breaker.last_used = time.time()
+    breakers.move_to_end(host)
+    return breaker
+
+
+@lru_cache()
+def get_negative_cache() -> NegativeCache:
+    """Get cached negative cache instance."""
+    return NegativeCache(config)
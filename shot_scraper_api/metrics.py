@@ -0,0 +1,162 @@
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# how many recent samples latency percentiles and the slow list are taken from
+WINDOW = 1000
+QUANTILES = [0.5, 0.95, 0.99]
+
+
+def percentile(samples: list, quantile: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+
+class Metrics:
+    """In process counters, gauges and latency windows
+
+    Rendered in the prometheus text format for /metrics, and summarized as
+    json for /stats, which the tui dashboard polls.
+    """
+
+    def __init__(self):
+        self.counters = defaultdict(float)
+        self.gauges = {}
+        self.help = {}
+        self.samples = defaultdict(lambda: deque(maxlen=WINDOW))
+        # running totals for the summary _sum and _count, samples only keeps
+        # the latest window
+        self.sums = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.events = defaultdict(lambda: deque(maxlen=WINDOW * 10))
+        self.recent = deque(maxlen=WINDOW)
+        self.started_at = time.time()
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return (name, tuple(sorted(labels.items())))
+
+    def describe(self, name: str, help: str) -> None:
+        self.help[name] = help
+
+    def incr(self, name: str, value: float = 1, **labels) -> None:
+        self.counters[self._key(name, labels)] += value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        self.gauges[self._key(name, labels)] = value
+
+    def unset(self, name: str, **labels) -> None:
+        self.gauges.pop(self._key(name, labels), None)
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = self._key(name, labels)
+        self.samples[key].append(value)
+        self.sums[key] += value
+        self.counts[key] += 1
+
+    @contextmanager
+    def time(self, name: str, **labels):
+        """Observe how long the block takes in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def event(self, name: str, **labels) -> None:
+        """Count something and remember when it happened, for rates"""
+        self.incr(name, **labels)
+        self.events[self._key(name, labels)].append(time.time())
+
+    def rate(self, name: str, window: float = 60, **labels) -> float:
+        """Events per second over the last window seconds
+
+        Without labels the events of every label set are counted.
+        """
+        since = time.time() - window
+        if labels:
+            keys = [self._key(name, labels)]
+        else:
+            keys = [key for key in self.events if key[0] == name]
+        return (
+            sum(1 for key in keys for at in self.events[key] if at >= since) / window
+        )
+
+    def record_request(self, url: str, seconds: float, tier: str) -> None:
+        self.recent.append({"url": url, "seconds": seconds, "tier": tier})
+
+    def slowest(self, count: int = 10) -> list:
+        return sorted(self.recent, key=lambda r: r["seconds"], reverse=True)[:count]
+
+    def latency(self, name: str) -> dict:
+        """count and percentiles for every label set of a timed metric"""
+        summary = {}
+        for (sample_name, labels), samples in self.samples.items():
+            if sample_name != name:
+                continue
+            label = ",".join(str(v) for _, v in labels) or name
+            summary[label] = {
+                "count": len(samples),
+                **{f"p{int(q * 100)}": percentile(list(samples), q) for q in QUANTILES},
+            }
+        return summary
+
+    def labelled(self, name: str) -> dict:
+        """Values of a counter or gauge keyed by its first label value"""
+        values = {}
+        for samples in (self.counters, self.gauges):
+            for (sample_name, labels), value in samples.items():
+                if sample_name == name and labels:
+                    values[labels[0][1]] = value
+        return values
+
+    def total(self, name: str) -> float:
+        """Sum of a counter over all of its label sets"""
+        return sum(
+            value
+            for (sample_name, _), value in self.counters.items()
+            if sample_name == name
+        )
+
+    def get(self, name: str, **labels) -> float:
+        key = self._key(name, labels)
+        return self.counters.get(key, self.gauges.get(key, 0))
+
+    def render(self) -> str:
+        lines = []
+        for kind, samples in [("counter", self.counters), ("gauge", self.gauges)]:
+            seen = set()
+            for (name, labels), value in sorted(samples.items()):
+                if name not in seen:
+                    seen.add(name)
+                    if name in self.help:
+                        lines.append(f"# HELP {name} {self.help[name]}")
+                    lines.append(f"# TYPE {name} {kind}")
+                label_str = ",".join(f'{k}="{v}"' for k, v in labels)
+                lines.append(
+                    f"{name}{{{label_str}}} {value}" if label_str else f"{name} {value}"
+                )
+        seen = set()
+        for (name, labels), samples in sorted(self.samples.items()):
+            if name not in seen:
+                seen.add(name)
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} summary")
+            samples = list(samples)
+            for quantile in QUANTILES:
+                label_str = ",".join(
+                    [*(f'{k}="{v}"' for k, v in labels), f'quantile="{quantile}"']
+                )
+                lines.append(f"{name}{{{label_str}}} {percentile(samples, quantile)}")
+            label_str = ",".join(f'{k}="{v}"' for k, v in labels)
+            label_str = f"{{{label_str}}}" if label_str else ""
+            key = (name, labels)
+            lines.append(f"{name}_sum{label_str} {self.sums[key]}")
+            lines.append(f"{name}_count{label_str} {self.counts[key]}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
@@ -1,6 +1,7 @@
 import boto3
 from botocore.config import Config as BotoConfig
 from botocore.exceptions import ClientError
+import asyncio
 import io
 import logging
 import os
@@ -40,6 +41,16 @@ class S3Client:
         self.config = config
         # self._ensure_bucket_exists()
 
+    @property
+    def index(self):
+        from shot_scraper_api.bucket_index import get_bucket_index
+
+        return get_bucket_index()
+
+    def _index_uploaded(self, filename: str, size: int) -> None:
+        """Record a freshly uploaded object in the local bucket index"""
+        self.index.add(filename, size)
+
     def _ensure_bucket_exists(self):
         """Ensure the configured bucket exists, create if it doesn't"""
         try:
@@ -87,8 +98,12 @@ class S3Client:
                     f"File size exceeds maximum allowed size of {self.config.max_file_size_mb} mb"
                 )
 
-            with open(filepath, "rb") as file:
-                self.s3.upload_fileobj(file, self.config.aws_bucket_name, filename)
+            def upload():
+                with open(filepath, "rb") as file:
+                    self.s3.upload_fileobj(file, self.config.aws_bucket_name, filename)
+                self._index_uploaded(filename, size)
+
+            await asyncio.to_thread(upload)
         except ClientError as e:
             raise Exception(f"Failed to upload file to S3: {str(e)}")
 
@@ -98,19 +113,23 @@ class S3Client:
             # Check file size
             size = len(content)
 
-            if size > config.MAX_FILE_SIZE:
+            if size > self.config.max_file_size_mb * 1024 * 1024:
                 raise ValueError(
-                    f"File size exceeds maximum allowed size of {config.MAX_FILE_SIZE} bytes"
+                    f"File size exceeds maximum allowed size of {self.config.max_file_size_mb} mb"
                 )
 
             # Create file-like object from bytes
             file_obj = io.BytesIO(content)
 
-            self.s3.upload_fileobj(file_obj, self.config.aws_bucket_name, filename)
+            def upload():
+                self.s3.upload_fileobj(file_obj, self.config.aws_bucket_name, filename)
+                self._index_uploaded(filename, size)
+
+            await asyncio.to_thread(upload)
 
             # Generate URL based on endpoint
-            if config.AWS_ENDPOINT_URL:
-                url = f"{config.AWS_ENDPOINT_URL}/{self.config.aws_bucket_name}/{filename}"
+            if self.config.aws_endpoint_url:
+                url = f"{self.config.aws_endpoint_url}/{self.config.aws_bucket_name}/{filename}"
             else:
                 url = (
                     f"https://{self.config.aws_bucket_name}.s3.amazonaws.com/{filename}"
@@ -119,26 +138,69 @@ class S3Client:
         except ClientError as e:
             raise Exception(f"Failed to upload file to S3: {str(e)}")
 
-    async def get_file(self, filename: str):
-        """Get a file from S3 as a streaming response"""
+    def _get_object(self, filename: str) -> dict:
+        """get_object that keeps the index current
+
+        Raises FileNotFoundError if the key is not in the bucket. Like every
+        index write this blocks, async callers run it in a thread.
+        """
+        if self.index.known_absent(filename):
+            raise FileNotFoundError(f"File not found in S3: {filename}")
         try:
             response = self.s3.get_object(
                 Bucket=self.config.aws_bucket_name, Key=filename
             )
+        except ClientError as e:
+            error_code = e.response["Error"]["Code"]
+            if error_code in ["404", "NoSuchKey"]:
+                self.index.remove(filename)
+                raise FileNotFoundError(f"File not found in S3: {filename}")
+            raise
+        self.index.touch(filename)
+        return response
+
+    def read_bytes(self, filename: str) -> bytes | None:
+        """Read a small file from S3 into memory, None if it does not exist
+
+        Blocking, async callers run it in a thread.
+        """
+        try:
+            return self._get_object(filename)["Body"].read()
+        except FileNotFoundError:
+            return None
+        except ClientError as e:
+            raise Exception(f"Failed to read file from S3: {str(e)}")
 
-            async def stream_response():
-                chunk_size = 8192  # 8KB chunks
-                body = response["Body"]
-                while True:
-                    chunk = body.read(chunk_size)
-                    if not chunk:
-                        break
-                    yield chunk
+    async def get_file(self, filename: str):
+        """Get a file from S3 as a streaming response
 
-            return stream_response()
+        Raises FileNotFoundError if the key is not in the bucket.
+        """
+        try:
+            response = await asyncio.to_thread(self._get_object, filename)
         except ClientError as e:
             raise Exception(f"Failed to get file from S3: {str(e)}")
 
+        async def stream_response():
+            chunk_size = 8192  # 8KB chunks
+            body = response["Body"]
+            while True:
+                chunk = await asyncio.to_thread(body.read, chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+        return stream_response()
+
+    async def download_file(self, filename: str, filepath: str) -> None:
+        """Download a file from S3 to a local path"""
+        try:
+            await asyncio.to_thread(
+                self.s3.download_file, self.config.aws_bucket_name, filename, filepath
+            )
+        except ClientError as e:
+            raise Exception(f"Failed to download file from S3: {str(e)}")
+
     async def get_file_url(self, filename: str, expires_in: int = 31536000) -> str:
         """Generate a presigned URL for file download"""
         try:
@@ -156,40 +218,84 @@ class S3Client:
     async def delete_file(self, filename: str) -> None:
         """Delete a file from S3 bucket"""
         try:
-            self.s3.delete_object(Bucket=self.config.aws_bucket_name, Key=filename)
+
+            def delete():
+                self.s3.delete_object(Bucket=self.config.aws_bucket_name, Key=filename)
+                self.index.remove(filename)
+
+            await asyncio.to_thread(delete)
         except ClientError as e:
             raise Exception(f"Failed to delete file from S3: {str(e)}")
 
-    async def list_files(self, prefix: str = None):
-        """List all files in the bucket, optionally filtered by prefix"""
+    def scan(self, prefix: str = None):
+        """Yield every object in the bucket, following list pagination"""
+        params = {"Bucket": self.config.aws_bucket_name}
+        if prefix:
+            params["Prefix"] = prefix
+
+        paginator = self.s3.get_paginator("list_objects_v2")
+        for response in paginator.paginate(**params):
+            yield from response.get("Contents", [])
+
+    def rebuild_index(self) -> int:
+        """Rebuild the local bucket index from a full scan of the bucket
+
+        Uses its own index connection so it can run in a worker thread while
+        requests keep reading the index.
+        """
+        from shot_scraper_api.bucket_index import BucketIndex
+
         try:
-            params = {"Bucket": self.config.aws_bucket_name}
-            if prefix:
-                params["Prefix"] = prefix
+            return BucketIndex(self.config).rebuild(self.scan())
+        except ClientError as e:
+            raise Exception(f"Failed to scan bucket: {str(e)}")
 
-            response = self.s3.list_objects_v2(**params)
+    async def gc(self, budget_bytes: int, dry_run: bool = False) -> list:
+        """Delete objects until the bucket fits budget_bytes
 
+        Objects go in the order of the local index, least recently read on
+        this machine first, falling back to upload time for objects it has
+        never read. Reads on other replicas are not seen, so run it where the
+        traffic is. index/ pointers are tiny and are left alone, a pointer to
+        collected content is treated as a miss and re-rendered. Returns the
+        deleted (key, size) pairs.
+        """
+        total = self.index.total_bytes()
+        deleted = []
+        for key, size in self.index.least_recently_used_locally():
+            if total <= budget_bytes:
+                break
+            if key.startswith("index/"):
+                continue
+            if not dry_run:
+                await self.delete_file(key)
+            deleted.append((key, size))
+            total -= size
+        return deleted
+
+    async def list_files(self, prefix: str = None):
+        """List all files in the bucket, optionally filtered by prefix"""
+        try:
             files = []
-            if "Contents" in response:
-                for obj in response["Contents"]:
-                    # Infer content type from extension
-                    ext = obj["Key"].split(".")[-1].lower() if "." in obj["Key"] else ""
-                    content_type = {
-                        "webp": "image/webp",
-                        "jpg": "image/jpeg",
-                        "jpeg": "image/jpeg",
-                        "png": "image/png",
-                        "gif": "image/gif",
-                    }.get(ext, "application/octet-stream")
-
-                    files.append(
-                        {
-                            "key": obj["Key"],
-                            "size": obj["Size"],
-                            "last_modified": obj["LastModified"].isoformat(),
-                            "content_type": content_type,
-                        }
-                    )
+            for obj in self.scan(prefix):
+                # Infer content type from extension
+                ext = obj["Key"].split(".")[-1].lower() if "." in obj["Key"] else ""
+                content_type = {
+                    "webp": "image/webp",
+                    "jpg": "image/jpeg",
+                    "jpeg": "image/jpeg",
+                    "png": "image/png",
+                    "gif": "image/gif",
+                }.get(ext, "application/octet-stream")
+
+                files.append(
+                    {
+                        "key": obj["Key"],
+                        "size": obj["Size"],
+                        "last_modified": obj["LastModified"].isoformat(),
+                        "content_type": content_type,
+                    }
+                )
 
             return files
         except ClientError as e:
@@ -198,14 +304,26 @@ class S3Client:
     def file_exists(self, filename: str) -> bool:
         """Check if a file exists in the S3 bucket.
 
+        Blocking, async callers run it in a thread.
+
         Args:
             filename: The name of the file (key) in the S3 bucket.
 
         Returns:
             bool: True if the file exists, False otherwise.
         """
+        if self.index.contains(filename):
+            return True
+        if self.index.known_absent(filename):
+            return False
         try:
-            self.s3.get_object(Bucket=self.config.aws_bucket_name, Key=filename)
+            head = self.s3.head_object(Bucket=self.config.aws_bucket_name, Key=filename)
+            self.index.add(
+                filename,
+                head["ContentLength"],
+                head.get("ETag"),
+                head["LastModified"].timestamp(),
+            )
             return True
         except self.s3.exceptions.ClientError as e:
             error_code = e.response["Error"]["Code"]
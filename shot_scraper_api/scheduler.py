@@ -0,0 +1,117 @@
+import asyncio
+import time
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager
+
+from shot_scraper_api.config import config
+from shot_scraper_api.metrics import metrics
+
+metrics.describe(
+    "shot_host_wait_seconds_total", "time renders spent waiting on a host slot"
+)
+
+
+class Waiter:
+    def __init__(self, host: str):
+        self.host = host
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class HostScheduler:
+    """Cap concurrent renders per target host and share slots fairly
+
+    Renders queue per group, the target host or the api client depending on
+    config.scheduler_fair_by, and free slots are handed out round robin
+    across groups. A render only starts while its host is under
+    max_per_host, so one slow site cannot take every slot and a noisy client
+    only ever gets its turn.
+    """
+
+    def __init__(self, max_total: int, max_per_host: int, fair_by: str = "host"):
+        self.max_total = max_total
+        self.max_per_host = max_per_host
+        self.fair_by = fair_by
+        self.queues = OrderedDict()
+        self.running_hosts = Counter()
+
+    @property
+    def running(self) -> int:
+        return sum(self.running_hosts.values())
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(queue) for queue in self.queues.values())
+
+    def _next_waiter(self):
+        """Pop the next runnable waiter, visiting groups round robin"""
+        for group in list(self.queues):
+            queue = self.queues[group]
+            for waiter in queue:
+                if self.running_hosts[waiter.host] < self.max_per_host:
+                    queue.remove(waiter)
+                    if queue:
+                        self.queues.move_to_end(group)
+                    else:
+                        del self.queues[group]
+                    return waiter
+        return None
+
+    def _dispatch(self) -> None:
+        while self.running < self.max_total:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            self.running_hosts[waiter.host] += 1
+            waiter.future.set_result(None)
+
+    def _release(self, host: str) -> None:
+        self.running_hosts[host] -= 1
+        if self.running_hosts[host] <= 0:
+            del self.running_hosts[host]
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, host: str, client: str):
+        """Wait for a render slot for host, queued fairly by host or client"""
+        group = client if self.fair_by == "client" else host
+        waiter = Waiter(host)
+        self.queues.setdefault(group, deque()).append(waiter)
+        self._dispatch()
+
+        queued_at = time.perf_counter()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # granted the slot in the same tick we were cancelled
+                self._release(host)
+            else:
+                queue = self.queues.get(group)
+                if queue is not None and waiter in queue:
+                    queue.remove(waiter)
+                    if not queue:
+                        del self.queues[group]
+            raise
+        waited = time.perf_counter() - queued_at
+        metrics.observe("shot_stage_seconds", waited, stage="host_wait")
+        # not labelled by host, callers choose the hosts
+        metrics.incr("shot_host_wait_seconds_total", waited)
+
+        try:
+            yield
+        finally:
+            self._release(host)
+
+    def stats(self) -> dict:
+        return {
+            "waiting": self.waiting,
+            "running": self.running,
+            "hosts": dict(self.running_hosts),
+        }
+
+
+render_scheduler = HostScheduler(
+    config.max_concurrent_renders,
+    config.max_renders_per_host,
+    config.scheduler_fair_by,
+)
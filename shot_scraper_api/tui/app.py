@@ -1,62 +1,173 @@
-# from pathlib import Path
-#
-# from textual.app import App, ComposeResult
-# from textual.containers import Container
-# from textual.css.query import NoMatches
-# from textual.widgets import Footer, Static
-#
-# from shot_scraper_api.config import config
-#
-# config["tui"] = {}
-# config["tui"]["bindings"] = {}
-#
-#
-# class Sidebar(Static):
-#     def compose(self) -> ComposeResult:
-#         yield Container(
-#             Static("sidebar"),
-#             id="sidebar",
-#         )
-#
-#
-# class Tui(App):
-#     """A Textual app to manage requests."""
-#
-#     CSS_PATH = Path("__file__").parent / "app.css"
-#     BINDINGS = [tuple(b.values()) for b in config["tui"]["bindings"]]
-#
-#     def compose(self) -> ComposeResult:
-#         """Create child widgets for the app."""
-#         yield Container(Static("hello world"))
-#         yield Footer()
-#
-#     def action_toggle_dark(self) -> None:
-#         """An action to toggle dark mode."""
-#         self.dark = not self.dark
-#
-#     def action_toggle_sidebar(self):
-#         try:
-#             self.query_one("PromptSidebar").remove()
-#         except NoMatches:
-#             self.mount(Sidebar())
-#
-#
-# def run_app():
-#     import os
-#     import sys
-#
-#     from textual.features import parse_features
-#
-#     dev = "--dev" in sys.argv
-#     features = set(parse_features(os.environ.get("TEXTUAL", "")))
-#     if dev:
-#         features.add("debug")
-#         features.add("devtools")
-#
-#     os.environ["TEXTUAL"] = ",".join(sorted(features))
-#     app = Tui()
-#     app.run()
-#
-#
-# if __name__ == "__main__":
-#     run_app()
+import asyncio
+import json
+from pathlib import Path
+from urllib.request import urlopen
+
+from rich.table import Table
+from textual.app import App, ComposeResult
+from textual.containers import Grid
+from textual.widgets import Footer, Header, Static
+
+from shot_scraper_api.config import config
+
+MB = 1024 * 1024
+
+
+def fetch_stats(api_url: str) -> dict:
+    with urlopen(f"{api_url.rstrip('/')}/stats", timeout=5) as response:
+        return json.load(response)
+
+
+def ms(seconds: float) -> str:
+    return f"{seconds * 1000:,.0f}ms"
+
+
+class Panel(Static):
+    """A titled box on the dashboard"""
+
+    def __init__(self, title: str, **kwargs):
+        super().__init__(**kwargs)
+        self.border_title = title
+
+
+class Tui(App):
+    """Live operations dashboard for a running shot-scraper-api"""
+
+    CSS_PATH = Path(__file__).parent / "app.css"
+    TITLE = "shot-scraper-api"
+    BINDINGS = [
+        ("q", "quit", "Quit"),
+        ("r", "refresh", "Refresh"),
+        ("d", "toggle_dark", "Toggle dark mode"),
+    ]
+
+    def __init__(self, api_url: str, refresh_interval: float, **kwargs):
+        super().__init__(**kwargs)
+        self.api_url = api_url
+        self.refresh_interval = refresh_interval
+
+    def compose(self) -> ComposeResult:
+        """Create child widgets for the app."""
+        yield Header()
+        yield Grid(
+            Panel("throughput", id="throughput"),
+            Panel("cache tiers", id="tiers"),
+            Panel("renders", id="renders"),
+            Panel("stage latency", id="latency"),
+            Panel("slowest recent urls", id="slowest"),
+            Panel("circuits", id="circuits"),
+            id="dashboard",
+        )
+        yield Footer()
+
+    def on_mount(self) -> None:
+        self.sub_title = self.api_url
+        self.set_interval(self.refresh_interval, self.action_refresh)
+        self.call_later(self.action_refresh)
+
+    async def action_refresh(self) -> None:
+        try:
+            stats = await asyncio.to_thread(fetch_stats, self.api_url)
+        except Exception as e:
+            self.sub_title = f"{self.api_url} unreachable: {e}"
+            return
+        self.sub_title = self.api_url
+        self.show_throughput(stats)
+        self.show_tiers(stats)
+        self.show_renders(stats)
+        self.show_latency(stats)
+        self.show_slowest(stats)
+        self.show_circuits(stats)
+
+    def show_throughput(self, stats: dict) -> None:
+        table = Table.grid(padding=(0, 2))
+        table.add_row("requests/s (1m)", f"{stats['requests_per_second']:.2f}")
+        table.add_row("requests", f"{stats['requests']:,.0f}")
+        table.add_row("uptime", f"{stats['uptime'] / 60:,.0f}m")
+        self.query_one("#throughput", Static).update(table)
+
+    def show_tiers(self, stats: dict) -> None:
+        table = Table(expand=True, box=None)
+        table.add_column("tier")
+        table.add_column("requests", justify="right")
+        table.add_column("ratio", justify="right")
+        for tier, tier_stats in sorted(stats["tiers"].items()):
+            table.add_row(
+                tier, f"{tier_stats['count']:,.0f}", f"{tier_stats['ratio']:.1%}"
+            )
+        lookups = stats["index_lookups"]
+        total = sum(lookups.values())
+        for tier, count in sorted(lookups.items()):
+            table.add_row(
+                f"index {tier}",
+                f"{count:,.0f}",
+                f"{count / total:.1%}" if total else "-",
+            )
+        self.query_one("#tiers", Static).update(table)
+
+    def show_renders(self, stats: dict) -> None:
+        renders = stats["renders"]
+        scheduler = stats["scheduler"]
+        table = Table.grid(padding=(0, 2))
+        table.add_row("waiting on host slot", str(scheduler["waiting"]))
+        table.add_row("waiting on memory", str(renders["queued"]))
+        table.add_row("running", str(renders["running"]))
+        used = renders["memory_used"]
+        budget = renders["memory_budget"]
+        table.add_row(
+            "memory",
+            (
+                f"{used / MB:,.0f} / {budget / MB:,.0f}mb ({used / budget:.0%})"
+                if budget
+                else "-"
+            ),
+        )
+        busiest = sorted(scheduler["hosts"].items(), key=lambda h: -h[1])[:5]
+        for host, running in busiest:
+            table.add_row(f"  {host}", str(running))
+        self.query_one("#renders", Static).update(table)
+
+    def show_latency(self, stats: dict) -> None:
+        table = Table(expand=True, box=None)
+        for column in ["stage", "n", "p50", "p95", "p99"]:
+            table.add_column(column, justify="left" if column == "stage" else "right")
+        for stage, latency in sorted(stats["latency"].items()):
+            table.add_row(
+                stage,
+                str(latency["count"]),
+                ms(latency["p50"]),
+                ms(latency["p95"]),
+                ms(latency["p99"]),
+            )
+        self.query_one("#latency", Static).update(table)
+
+    def show_slowest(self, stats: dict) -> None:
+        table = Table(expand=True, box=None)
+        table.add_column("time", justify="right")
+        table.add_column("tier")
+        table.add_column("url", overflow="ellipsis", no_wrap=True)
+        for request in stats["slowest"]:
+            table.add_row(ms(request["seconds"]), request["tier"], request["url"])
+        self.query_one("#slowest", Static).update(table)
+
+    def show_circuits(self, stats: dict) -> None:
+        states = {0: "closed", 1: "[yellow]half open[/]", 2: "[red]open[/]"}
+        table = Table(expand=True, box=None)
+        table.add_column("host")
+        table.add_column("state")
+        # closed breakers are not reported, open ones first
+        for host, state in sorted(stats["circuits"].items(), key=lambda c: -c[1]):
+            table.add_row(host, states.get(int(state), str(state)))
+        self.query_one("#circuits", Static).update(table)
+
+
+def run_app(api_url: str | None = None, refresh_interval: float | None = None):
+    app = Tui(
+        api_url=api_url or config.tui_api_url,
+        refresh_interval=refresh_interval or config.tui_refresh_interval,
+    )
+    app.run()
+
+
+if __name__ == "__main__":
+    run_app()
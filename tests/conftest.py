@@ -0,0 +1,6 @@
+import os
+import tempfile
+
+# importing shot_scraper_api builds the config and the caches under its
+# cache_dir, keep the tests out of the real one
+os.environ["CACHE_DIR"] = tempfile.mkdtemp(prefix="shot-scraper-api-tests-")
@@ -0,0 +1,314 @@
+import asyncio
+import hashlib
+
+import pytest
+from fastapi import Request
+from fastapi.testclient import TestClient
+
+from shot_scraper_api.api import app as api
+
+URL = "https://example.com/"
+CHROME_IMG_ACCEPT = "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8"
+
+
+class FakeStore:
+    """Content store holding only shots saved under the md5 key schema"""
+
+    def __init__(self, legacy):
+        self.legacy = legacy
+        self.index = {}
+
+    async def lookup(self, imgname):
+        return self.index.get(imgname)
+
+    async def migrate(self, old_imgname, imgname):
+        if old_imgname not in self.legacy:
+            return None
+        self.index[imgname] = self.legacy[old_imgname]
+        return self.index[imgname]
+
+    async def get(self, digest):
+        async def stream():
+            yield digest.encode()
+
+        return stream()
+
+
+@pytest.fixture
+def client():
+    return TestClient(api.app)
+
+
+def legacy_webp_key(url):
+    return hashlib.md5(url.encode()).hexdigest() + "-800x450-800x450.webp"
+
+
+def test_negotiated_request_falls_back_to_the_legacy_webp(client, monkeypatch):
+    store = FakeStore({legacy_webp_key(URL): "webpdigest"})
+    monkeypatch.setattr(api, "get_content_store", lambda: store)
+
+    response = client.get(
+        "/shot/", params={"url": URL}, headers={"accept": CHROME_IMG_ACCEPT}
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/webp"
+    assert response.headers["vary"] == "Accept"
+    assert response.content == b"webpdigest"
+    assert list(store.index) == [api.build_key(URL, 800, 450, 800, 450, [], "webp")]
+
+
+def test_no_webp_fallback_when_webp_is_refused(client, monkeypatch):
+    store = FakeStore({legacy_webp_key(URL): "webpdigest"})
+    monkeypatch.setattr(api, "get_content_store", lambda: store)
+    negative = api.get_negative_cache()
+    negative.add(api.build_key(URL, 800, 450, 800, 450, [], "jpg"), "failed")
+
+    response = client.get(
+        "/shot/", params={"url": URL}, headers={"accept": "image/webp;q=0, */*"}
+    )
+
+    assert response.status_code == 503
+    assert store.index == {}
+
+
+def test_explicit_format_does_not_fall_back(client, monkeypatch):
+    store = FakeStore({legacy_webp_key(URL): "webpdigest"})
+    monkeypatch.setattr(api, "get_content_store", lambda: store)
+    negative = api.get_negative_cache()
+    imgname = api.build_key(URL, 800, 450, 800, 450, [], "avif")
+    negative.add(imgname, "failed")
+
+    response = client.get("/shot/shot.avif", params={"url": URL})
+
+    # straight past the stored webp to the (cached) failed avif render
+    assert response.status_code == 503
+    assert store.index == {}
+
+
+def test_scheme_is_checked_after_canonicalizing(client, monkeypatch):
+    store = FakeStore({})
+    store.index[api.build_key(URL, 800, 450, 800, 450, [], "webp")] = "digest"
+    monkeypatch.setattr(api, "get_content_store", lambda: store)
+
+    response = client.get("/shot/shot.webp", params={"url": "HTTPS://Example.com"})
+
+    assert response.status_code == 200
+    assert response.content == b"digest"
+
+
+@pytest.mark.parametrize("url", ["httpx://example.com/", "ftp://example.com/"])
+def test_non_http_urls_are_refused(client, url):
+    response = client.get("/shot/shot.webp", params={"url": url})
+
+    assert response.status_code == 404
+
+
+class VariantStore(FakeStore):
+    def __init__(self, index):
+        super().__init__({})
+        self.index = dict(index)
+        self.puts = []
+
+    async def put(self, filepath, imgname):
+        self.puts.append(imgname)
+        self.index[imgname] = "digest"
+        return "digest"
+
+
+async def test_store_variants_skips_stored_formats(monkeypatch, tmp_path):
+    store = VariantStore({"shot.avif": "digest"})
+    encoded = []
+
+    async def encode_variants(source, outputs, preset):
+        encoded.extend(outputs)
+        for output in outputs.values():
+            open(output, "wb").close()
+        return {format: True for format in outputs}
+
+    monkeypatch.setattr(api, "get_content_store", lambda: store)
+    monkeypatch.setattr(api, "encode_variants", encode_variants)
+    workdir = tmp_path / "render"
+    workdir.mkdir()
+
+    await api.store_variants(
+        str(workdir / "raw.png"),
+        str(workdir),
+        {"avif": "shot.avif", "jpg": "shot.jpg"},
+        "balanced",
+    )
+
+    assert encoded == ["jpg"]
+    assert store.puts == ["shot.jpg"]
+    assert not workdir.exists()
+
+
+async def test_store_variants_are_limited(monkeypatch, tmp_path):
+    store = VariantStore({})
+    running = []
+    most = 0
+
+    async def encode_variants(source, outputs, preset):
+        nonlocal most
+        running.append(source)
+        most = max(most, len(running))
+        await asyncio.sleep(0.01)
+        running.remove(source)
+        return {format: False for format in outputs}
+
+    monkeypatch.setattr(api, "get_content_store", lambda: store)
+    monkeypatch.setattr(api, "encode_variants", encode_variants)
+    monkeypatch.setattr(api, "variant_encodes", asyncio.Semaphore(2))
+
+    await asyncio.gather(
+        *(
+            api.store_variants(
+                str(tmp_path / f"{n}.png"),
+                str(tmp_path / str(n)),
+                {"jpg": f"{n}.jpg"},
+                "fast",
+            )
+            for n in range(5)
+        )
+    )
+
+    assert most == 2
+
+
+class FakePage:
+    def __init__(self, page_height):
+        self.page_height = page_height
+        self.shots = 0
+
+    async def evaluate(self, script):
+        if "scrollHeight" in script:
+            return self.page_height
+
+    async def screenshot(self, options):
+        self.shots += 1
+        open(options["path"], "wb").close()
+
+
+@pytest.fixture
+def commands(monkeypatch):
+    commands = []
+
+    async def run_command(cmd):
+        commands.append(cmd)
+        open(cmd[-1], "wb").close()
+        return True
+
+    monkeypatch.setattr(api, "run_command", run_command)
+    return commands
+
+
+def tile_heights(commands, scaled_width):
+    return [
+        int(cmd[cmd.index("-resize") + 1][len(f"{scaled_width}x") : -1])
+        for cmd in commands
+        if "-resize" in cmd
+    ]
+
+
+@pytest.mark.parametrize("scaled_width", [1200, 1000, 333])
+async def test_full_page_cap_applies_to_the_output(
+    commands, monkeypatch, tmp_path, scaled_width
+):
+    monkeypatch.setattr(api.config, "full_page_max_height", 16000)
+    output = str(tmp_path / "raw.png")
+
+    await api.take_full_page_screenshot(
+        FakePage(100_000), 800, 450, scaled_width, output
+    )
+
+    heights = tile_heights(commands, scaled_width)
+    assert sum(heights) <= 16000
+    assert sum(heights) > 16000 - 450 * scaled_width / 800
+    assert commands[-1][-2:] == ["-append", output]
+
+
+async def test_full_page_cap_stays_under_the_webp_limit(
+    commands, monkeypatch, tmp_path
+):
+    monkeypatch.setattr(api.config, "full_page_max_height", 50000)
+
+    await api.take_full_page_screenshot(
+        FakePage(100_000), 800, 450, 1600, str(tmp_path / "raw.png")
+    )
+
+    assert sum(tile_heights(commands, 1600)) <= api.WEBP_MAX_DIMENSION
+
+
+async def test_short_full_page_is_a_single_tile(commands, tmp_path):
+    page = FakePage(300)
+    output = tmp_path / "raw.png"
+
+    await api.take_full_page_screenshot(page, 800, 450, 800, str(output))
+
+    assert page.shots == 1
+    assert len(commands) == 1
+    assert "-resize" not in commands[0]
+    assert output.exists()
+
+
+def test_full_page_ignores_scaled_height(client, monkeypatch):
+    imgname = api.build_key(URL, 800, 450, 400, 450, [], "webp", True)
+    store = FakeStore({})
+    store.index[imgname] = "fulldigest"
+    monkeypatch.setattr(api, "get_content_store", lambda: store)
+
+    response = client.get(
+        "/shot/shot.webp",
+        params={
+            "url": URL,
+            "full_page": True,
+            "scaled_width": 400,
+            "scaled_height": 900,
+        },
+    )
+
+    assert response.status_code == 200
+    assert response.content == b"fulldigest"
+
+
+@pytest.mark.parametrize(
+    "headers,expected",
+    [
+        ({"x-forwarded-for": "6.6.6.6, 10.0.0.7"}, "10.0.0.7"),
+        ({"x-forwarded-for": "10.0.0.7"}, "10.0.0.7"),
+        ({}, "testclient"),
+    ],
+)
+def test_client_id_trusts_the_last_hop(headers, expected):
+    request = Request(
+        {
+            "type": "http",
+            "headers": [(k.encode(), v.encode()) for k, v in headers.items()],
+            "client": ("testclient", 50000),
+        }
+    )
+
+    assert api.client_id(request) == expected
+
+
+@pytest.mark.parametrize(
+    "url,expected",
+    [
+        ("https://example.com/a?token=secret#x", "https://example.com/a"),
+        ("https://user:pw@example.com:8443/", "https://example.com:8443/"),
+        ("http://[::1/", ""),
+    ],
+)
+def test_redact_url(url, expected):
+    assert api.redact_url(url) == expected
+
+
+def test_stats_do_not_leak_query_strings(client, monkeypatch):
+    store = FakeStore({legacy_webp_key(URL + "?token=secret"): "digest"})
+    monkeypatch.setattr(api, "get_content_store", lambda: store)
+
+    client.get("/shot/shot.webp", params={"url": URL + "?token=secret"})
+    stats = client.get("/stats").json()
+
+    assert "secret" not in str(stats)
+    assert stats["requests"] == api.metrics.total("shot_requests_total")
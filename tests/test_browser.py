@@ -0,0 +1,89 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from shot_scraper_api import browser
+from shot_scraper_api.browser import MB, MemoryBudget, MemoryLimitExceeded
+
+
+async def test_oversize_render_is_admitted_alone():
+    budget = MemoryBudget(100)
+
+    async with budget.reserve(500):
+        assert budget.used == 500
+        assert budget.running == 1
+
+    assert budget.used == 0
+
+
+async def test_waiters_wake_when_a_reservation_is_released():
+    budget = MemoryBudget(100)
+    admitted = asyncio.Event()
+
+    async def second():
+        async with budget.reserve(60):
+            admitted.set()
+
+    async with budget.reserve(60):
+        waiter = asyncio.create_task(second())
+        await asyncio.sleep(0)
+        assert budget.waiting == 1
+        assert not admitted.is_set()
+
+    await asyncio.wait_for(admitted.wait(), 1)
+    await waiter
+    assert budget.waiting == 0
+    assert budget.used == 0
+
+
+async def test_update_tracks_real_usage():
+    budget = MemoryBudget(100)
+
+    async with budget.reserve(60) as token:
+        budget.update(token, 80, 60)
+        assert budget.used == 80
+        budget.update(token, 10, 60)
+        assert budget.used == 60
+
+    budget.update(token, 80, 60)
+    assert budget.used == 0
+
+
+@pytest.fixture
+def fake_browser(monkeypatch):
+    killed = []
+    monkeypatch.setattr(browser.config, "render_memory_limit_mb", 1)
+    monkeypatch.setattr(browser.config, "render_memory_sample_interval", 0)
+    monkeypatch.setattr(browser, "process_tree_rss", lambda pid: 2 * MB)
+    monkeypatch.setattr(browser, "kill_process_tree", killed.append)
+    return SimpleNamespace(process=SimpleNamespace(pid=1234), killed=killed)
+
+
+async def test_watchdog_kill_raises(fake_browser):
+    unwound = []
+
+    async def render():
+        try:
+            await asyncio.sleep(10)
+        finally:
+            unwound.append(True)
+
+    async with browser.memory_budget.reserve(0) as token:
+        with pytest.raises(MemoryLimitExceeded):
+            await browser.run_watched(fake_browser, render(), token)
+
+    assert fake_browser.killed == [1234]
+    assert unwound == [True]
+
+
+async def test_render_result_is_returned(fake_browser, monkeypatch):
+    monkeypatch.setattr(browser, "process_tree_rss", lambda pid: 0)
+
+    async def render():
+        return "shot"
+
+    async with browser.memory_budget.reserve(0) as token:
+        assert await browser.run_watched(fake_browser, render(), token) == "shot"
+
+    assert fake_browser.killed == []
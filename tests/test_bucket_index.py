@@ -0,0 +1,88 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from shot_scraper_api.bucket_index import BucketIndex
+
+
+def scanned(key, size=10, modified=1_000_000):
+    return {
+        "Key": key,
+        "Size": size,
+        "ETag": f'"{key}"',
+        "LastModified": datetime.fromtimestamp(modified, tz=timezone.utc),
+    }
+
+
+@pytest.fixture
+def index(tmp_path):
+    return BucketIndex(SimpleNamespace(cache_dir=tmp_path, bucket_index_ttl=600))
+
+
+def test_rebuild_replaces_the_index(index):
+    index.add("gone.webp", 5, created=1)
+    index.conn.execute("UPDATE objects SET last_access = 1")
+
+    assert index.rebuild([scanned("a.webp", 10), scanned("b.webp", 20)]) == 2
+
+    assert index.contains("a.webp")
+    assert index.contains("b.webp")
+    assert not index.contains("gone.webp")
+    assert index.total_bytes() == 30
+    assert index.is_fresh()
+
+
+def test_rebuild_keeps_keys_written_during_the_scan(index):
+    def objects():
+        # uploaded after the paginator went past where it sorts
+        index.add("content/new", 42)
+        yield scanned("content/old")
+
+    index.rebuild(objects())
+
+    assert index.contains("content/new")
+    assert index.contains("content/old")
+
+
+def test_rebuild_keeps_last_access(index):
+    index.rebuild([scanned("a.webp"), scanned("b.webp", modified=2_000_000)])
+    index.touch("a.webp")
+    index.rebuild([scanned("a.webp"), scanned("b.webp", modified=2_000_000)])
+
+    assert [key for key, _ in index.least_recently_used_locally()] == [
+        "b.webp",
+        "a.webp",
+    ]
+
+
+def test_least_recently_used_locally_by_prefix(index):
+    index.rebuild([scanned("content/a"), scanned("index/a"), scanned("old.webp")])
+
+    assert index.least_recently_used_locally("content/") == [("content/a", 10)]
+
+
+def test_known_absent_needs_a_fresh_scan(index):
+    assert not index.known_absent("old.webp")
+
+    index.rebuild([scanned("other.webp")])
+    assert index.known_absent("old.webp")
+    assert not index.known_absent("other.webp")
+
+    index.config.bucket_index_ttl = 0
+    assert not index.known_absent("old.webp")
+
+
+def test_known_absent_never_trusts_shared_keys(index):
+    index.rebuild([])
+
+    assert not index.known_absent("index/v2-abc.webp")
+    assert not index.known_absent("content/abc")
+
+
+def test_add_remove(index):
+    index.add("a.webp", 10)
+    assert index.contains("a.webp")
+    index.remove("a.webp")
+    assert not index.contains("a.webp")
+    assert index.stats()["keys"] == 0
@@ -0,0 +1,65 @@
+import hashlib
+
+import pytest
+
+from shot_scraper_api.cache_key import build_key, canonicalize_url, legacy_key
+
+TRACKING = ["utm_*", "fbclid"]
+
+
+@pytest.mark.parametrize(
+    "url,expected",
+    [
+        ("HTTPS://Example.COM:443/?b=2&a=1#frag", "https://example.com/?a=1&b=2"),
+        ("http://example.com:80", "http://example.com/"),
+        ("http://example.com:8080/a", "http://example.com:8080/a"),
+        ("https://example.com/?utm_source=x&fbclid=y&q=1", "https://example.com/?q=1"),
+        ("https://user:pw@Example.com/", "https://user:pw@example.com/"),
+        ("http://[::1]:8000/", "http://[::1]:8000/"),
+        ("  https://example.com/path  ", "https://example.com/path"),
+    ],
+)
+def test_canonicalize_url(url, expected):
+    assert canonicalize_url(url, TRACKING) == expected
+
+
+@pytest.mark.parametrize(
+    "url", ["http://example.com:99999/", "http://example.com:port/", "http:///path"]
+)
+def test_canonicalize_url_rejects_bad_urls(url):
+    with pytest.raises(ValueError):
+        canonicalize_url(url, TRACKING)
+
+
+def test_equivalent_urls_share_a_key():
+    args = (800, 450, 800, 450)
+    assert build_key(
+        "https://Example.com/?b=2&a=1&utm_medium=x", *args, ["h1", " nav"], "webp"
+    ) == build_key("https://example.com:443/?a=1&b=2", *args, ["nav", "h1"], "webp")
+
+
+def test_key_varies_with_the_spec():
+    args = ("https://example.com/", 800, 450, 800, 450, [])
+    keys = {
+        build_key(*args, "webp"),
+        build_key(*args, "png"),
+        build_key(*args, "webp", full_page=True),
+        build_key(*args, "webp", preset="fast"),
+    }
+    assert len(keys) == 4
+
+
+@pytest.mark.parametrize(
+    "url,selectors",
+    [
+        ("https://example.com", []),
+        ("https://Example.com/Path?Q=1", ["#Main", ".nav"]),
+    ],
+)
+def test_legacy_key_matches_the_md5_schema(url, selectors):
+    # the key get_shot built before the key schema was versioned
+    md5_key = (
+        hashlib.md5(f"{url}{''.join(selectors)}".encode()).hexdigest()
+        + f"-{800}x{450}-{400}x{225}.{'webp'}"
+    ).lower()
+    assert legacy_key(url, 800, 450, 400, 225, selectors, "webp") == md5_key
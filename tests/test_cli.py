@@ -0,0 +1,41 @@
+from typer.testing import CliRunner
+
+from shot_scraper_api.cache_key import build_key
+from shot_scraper_api.cli.cache import cache_app
+from shot_scraper_api.config import config
+
+URL = "https://example.com/"
+
+runner = CliRunner()
+
+
+def test_key_uses_the_configured_preset(monkeypatch):
+    monkeypatch.setattr(config, "encoder_preset", "fast")
+
+    result = runner.invoke(cache_app, ["key", URL])
+
+    assert result.exit_code == 0
+    assert result.stdout.strip() == build_key(
+        URL, 800, 450, 800, 450, [], "webp", preset="fast"
+    )
+
+
+def test_key_maps_jpeg_to_jpg():
+    result = runner.invoke(cache_app, ["key", URL, "--format", "jpeg"])
+
+    assert result.exit_code == 0
+    assert result.stdout.strip().endswith(".jpg")
+
+
+def test_key_rejects_unknown_formats():
+    result = runner.invoke(cache_app, ["key", URL, "--format", "gif"])
+
+    assert result.exit_code == 2
+    assert "--format" in result.output
+
+
+def test_key_rejects_unknown_presets():
+    result = runner.invoke(cache_app, ["key", URL, "--preset", "tiny"])
+
+    assert result.exit_code == 2
+    assert "--preset" in result.output
@@ -0,0 +1,177 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from shot_scraper_api.content import ContentStore
+
+
+class FakeS3:
+    """In memory stand in for S3Client"""
+
+    def __init__(self):
+        self.objects = {}
+        self.downloads = []
+
+    def read_bytes(self, filename):
+        return self.objects.get(filename)
+
+    def file_exists(self, filename):
+        return filename in self.objects
+
+    async def upload_file(self, filepath, filename):
+        with open(filepath, "rb") as file:
+            self.objects[filename] = file.read()
+
+    async def upload_bytes(self, filename, content):
+        self.objects[filename] = content
+
+    async def download_file(self, filename, filepath):
+        self.downloads.append(filepath)
+        await asyncio.sleep(0)
+        with open(filepath, "wb") as file:
+            file.write(self.objects[filename])
+
+
+@pytest.fixture
+def s3():
+    return FakeS3()
+
+
+@pytest.fixture
+def store(tmp_path, s3):
+    return ContentStore(SimpleNamespace(cache_dir=tmp_path, s3_client=s3))
+
+
+async def test_migrate_stores_a_legacy_object(store, s3):
+    s3.objects["old.webp"] = b"x" * 10
+
+    digest = await store.migrate("old.webp", "v2-new.webp")
+
+    assert s3.objects[store.content_key(digest)] == b"x" * 10
+    assert s3.objects[store.index_key("v2-new.webp")] == digest.encode()
+    assert await store.lookup("v2-new.webp") == digest
+
+
+async def test_migrate_missing_legacy_object(store, s3):
+    assert await store.migrate("old.webp", "v2-new.webp") is None
+    assert s3.objects == {}
+
+
+async def test_concurrent_migrations_do_not_share_files(store, s3):
+    s3.objects["old.webp"] = b"x" * 10
+
+    digests = await asyncio.gather(
+        *(store.migrate("old.webp", "v2-new.webp") for _ in range(3))
+    )
+
+    assert len(set(digests)) == 1
+    assert len(set(s3.downloads)) == 3
+
+
+def write(tmp_path, name, content):
+    path = tmp_path / name
+    path.write_bytes(content)
+    return str(path)
+
+
+def consistent(stats):
+    return stats["bytes_saved"] == stats["logical_bytes"] - stats["stored_bytes"]
+
+
+async def test_put_dedupes_identical_content(store, s3, tmp_path):
+    shot = write(tmp_path, "shot", b"x" * 1000)
+
+    digest = await store.put(shot, "a.webp")
+    assert await store.put(shot, "b.webp") == digest
+
+    assert [key for key in s3.objects if key.startswith("content/")] == [
+        store.content_key(digest)
+    ]
+    stats = store.stats()
+    assert stats["keys"] == 2
+    assert stats["objects"] == 1
+    assert stats["dedupe_hits"] == 1
+    assert stats["logical_bytes"] == 2000
+    assert stats["stored_bytes"] == 1000
+    assert stats["bytes_saved"] == 1000
+    assert stats["dedupe_ratio"] == 2.0
+
+
+async def test_storing_a_key_again_is_not_a_dedupe(store, tmp_path):
+    shot = write(tmp_path, "shot", b"x" * 1000)
+    for _ in range(3):
+        await store.put(shot, "a.webp")
+    await store.put(shot, "b.webp")
+
+    stats = store.stats()
+    assert stats["keys"] == 2
+    assert stats["dedupe_hits"] == 1
+    assert stats["bytes_saved"] == 1000
+    assert consistent(stats)
+
+
+async def test_content_from_another_replica_counts_once(store, s3, tmp_path):
+    shot = write(tmp_path, "shot", b"x" * 1000)
+    s3.objects[store.content_key(store.hash_file(shot))] = b"x" * 1000
+
+    await store.put(shot, "a.webp")
+
+    stats = store.stats()
+    assert stats["objects"] == 1
+    assert stats["dedupe_hits"] == 0
+    assert consistent(stats)
+
+
+async def test_relinking_to_new_content(store, tmp_path):
+    old = write(tmp_path, "old", b"x" * 1000)
+    new = write(tmp_path, "new", b"y" * 400)
+    await store.put(old, "a.webp")
+    await store.put(old, "b.webp")
+
+    await store.put(new, "a.webp")
+
+    stats = store.stats()
+    assert stats["keys"] == 2
+    assert stats["objects"] == 2
+    assert stats["dedupe_hits"] == 0
+    assert stats["logical_bytes"] == 1400
+    assert stats["stored_bytes"] == 1400
+    assert consistent(stats)
+
+
+async def test_forget_collected_content(store, tmp_path):
+    kept = write(tmp_path, "kept", b"k" * 100)
+    collected = write(tmp_path, "collected", b"c" * 1000)
+    await store.put(kept, "kept.webp")
+    digest = await store.put(collected, "a.webp")
+    await store.put(collected, "b.webp")
+
+    store.forget({digest: 1000})
+
+    stats = store.stats()
+    assert stats["keys"] == 1
+    assert stats["objects"] == 1
+    assert stats["logical_bytes"] == 100
+    assert stats["stored_bytes"] == 100
+    assert consistent(stats)
+    assert store.cache.get("key:a.webp") is None
+
+    # rendered again, counted again
+    await store.put(collected, "a.webp")
+    stats = store.stats()
+    assert stats["keys"] == 2
+    assert stats["stored_bytes"] == 1100
+    assert consistent(stats)
+
+
+async def test_empty_store_stats(store):
+    assert store.stats() == {
+        "keys": 0,
+        "objects": 0,
+        "dedupe_hits": 0,
+        "logical_bytes": 0,
+        "stored_bytes": 0,
+        "bytes_saved": 0,
+        "dedupe_ratio": 1.0,
+    }
@@ -0,0 +1,39 @@
+import pytest
+
+from shot_scraper_api.encode import PRESETS, encode_command, negotiate_format
+
+
+@pytest.mark.parametrize(
+    "accept,expected",
+    [
+        (None, "webp"),
+        ("", "webp"),
+        ("image/avif,image/webp,image/apng,image/*,*/*;q=0.8", "avif"),
+        ("image/webp,*/*", "webp"),
+        ("*/*", "webp"),
+        ("image/*", "webp"),
+        ("image/avif;q=0,image/webp", "webp"),
+        ("image/avif;q=0.0, image/jpeg", "jpg"),
+        ("image/AVIF;q=0.5", "avif"),
+        ("image/webp;q=0, image/jpeg;q=0.9", "jpg"),
+        ("image/png", "png"),
+        ("image/avif;q=bogus, image/png", "png"),
+        ("text/html", "webp"),
+        ("image/webp;q=0, */*", "jpg"),
+        ("image/webp;q=0, image/*;q=0.8", "jpg"),
+        ("image/webp;q=0", "jpg"),
+        ("image/webp;q=0, image/jpeg;q=0, */*", "png"),
+    ],
+)
+def test_negotiate_format(accept, expected):
+    assert negotiate_format(accept) == expected
+
+
+@pytest.mark.parametrize("preset", PRESETS)
+@pytest.mark.parametrize("format", ["avif", "webp", "jpg", "png"])
+def test_encode_command(preset, format):
+    cmd = encode_command(format, preset, "in.png", "out")
+
+    assert "in.png" in cmd
+    assert "out" in cmd
+    assert all(arg in cmd for arg in PRESETS[preset][format])
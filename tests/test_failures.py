@@ -0,0 +1,130 @@
+from types import SimpleNamespace
+
+import pytest
+
+from shot_scraper_api import failures
+from shot_scraper_api.failures import CircuitBreaker
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(failures.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def breaker(clock):
+    config = SimpleNamespace(circuit_failure_threshold=3, circuit_reset_timeout=30)
+    return CircuitBreaker("example.com", config)
+
+
+def trip(breaker):
+    for _ in range(breaker.config.circuit_failure_threshold):
+        assert breaker.allow()
+        breaker.record_failure()
+
+
+def test_opens_after_threshold_failures_in_a_row(breaker):
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.retry_after() == 30
+
+
+def test_half_opens_for_a_single_probe(breaker, clock):
+    trip(breaker)
+    clock.now += 30
+
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+
+
+def test_probe_success_closes(breaker, clock):
+    trip(breaker)
+    clock.now += 30
+    assert breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+    assert breaker.allow()
+
+
+def test_probe_failure_reopens(breaker, clock):
+    trip(breaker)
+    clock.now += 30
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.retry_after() == 30
+
+
+def test_released_probe_is_not_a_failure(breaker, clock):
+    trip(breaker)
+    clock.now += 30
+    assert breaker.allow()
+    failures_before = breaker.failures
+
+    breaker.release_probe()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.failures == failures_before
+    assert breaker.allow()
+
+
+@pytest.fixture
+def breakers(monkeypatch, clock):
+    monkeypatch.setattr(failures, "breakers", failures.OrderedDict())
+    monkeypatch.setattr(failures.config, "circuit_reset_timeout", 30)
+    monkeypatch.setattr(failures.config, "circuit_failure_threshold", 1)
+    monkeypatch.setattr(failures.config, "circuit_max_hosts", 3)
+    return failures.breakers
+
+
+def test_idle_closed_breakers_are_forgotten(breakers, clock):
+    failures.get_breaker("closed.example")
+    failures.get_breaker("open.example").record_failure()
+    clock.now += 31
+
+    failures.get_breaker("new.example")
+    assert list(breakers) == ["open.example", "new.example"]
+
+
+def test_breakers_are_capped(breakers, clock):
+    for n in range(5):
+        failures.get_breaker(f"{n}.example").record_failure()
+
+    assert list(breakers) == ["2.example", "3.example", "4.example"]
+    assert set(failures.metrics.labelled("shot_circuit_state")) >= set(breakers)
+    assert "0.example" not in failures.metrics.labelled("shot_circuit_state")
+
+
+def test_closed_breakers_have_no_series(breakers):
+    breaker = failures.get_breaker("flaky.example")
+    assert "flaky.example" not in failures.metrics.labelled("shot_circuit_state")
+
+    breaker.record_failure()
+    assert failures.metrics.labelled("shot_circuit_state")["flaky.example"] == 2
+
+    breaker.opened_at -= 30
+    breaker.allow()
+    breaker.record_success()
+    assert "flaky.example" not in failures.metrics.labelled("shot_circuit_state")
@@ -0,0 +1,41 @@
+from shot_scraper_api.metrics import Metrics
+
+
+def test_counters_render_once_per_label_set():
+    metrics = Metrics()
+    metrics.describe("shot_requests_total", "shot requests")
+    metrics.event("shot_requests_total", tier="store")
+    metrics.event("shot_requests_total", tier="store")
+    metrics.event("shot_requests_total", tier="render")
+
+    lines = metrics.render().splitlines()
+
+    assert 'shot_requests_total{tier="store"} 2.0' in lines
+    assert 'shot_requests_total{tier="render"} 1.0' in lines
+    assert not any(line.startswith("shot_requests_total ") for line in lines)
+    assert metrics.total("shot_requests_total") == 3
+    assert metrics.rate("shot_requests_total") == 3 / 60
+    assert metrics.rate("shot_requests_total", tier="render") == 1 / 60
+
+
+def test_summaries_have_sum_and_count():
+    metrics = Metrics()
+    metrics.observe("shot_stage_seconds", 1.0, stage="capture")
+    metrics.observe("shot_stage_seconds", 3.0, stage="capture")
+    metrics.observe("shot_request_seconds", 0.5)
+
+    lines = metrics.render().splitlines()
+
+    assert "# TYPE shot_stage_seconds summary" in lines
+    assert 'shot_stage_seconds_sum{stage="capture"} 4.0' in lines
+    assert 'shot_stage_seconds_count{stage="capture"} 2' in lines
+    assert "shot_request_seconds_sum 0.5" in lines
+    assert "shot_request_seconds_count 1" in lines
+
+
+def test_unset_gauge():
+    metrics = Metrics()
+    metrics.set("shot_circuit_state", 2, host="example.com")
+    metrics.unset("shot_circuit_state", host="example.com")
+
+    assert metrics.labelled("shot_circuit_state") == {}
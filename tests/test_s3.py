@@ -0,0 +1,66 @@
+import io
+from types import SimpleNamespace
+
+import pytest
+from botocore.stub import Stubber
+
+from shot_scraper_api.s3 import S3Client
+
+
+@pytest.fixture
+def client():
+    config = SimpleNamespace(
+        aws_profile=None,
+        aws_endpoint_url="http://localhost:9000",
+        aws_access_key_id="key",
+        aws_secret_access_key="secret",
+        aws_region="us-east-1",
+        aws_bucket_name="shots",
+        max_file_size_mb=1,
+    )
+    client = S3Client(config)
+    with Stubber(client.s3) as stubber:
+        client.stubber = stubber
+        yield client
+
+
+async def test_upload_bytes_indexes_the_local_size(client):
+    client.stubber.add_response("put_object", {})
+
+    await client.upload_bytes("index/a.webp", b"digest")
+
+    assert client.index.contains("index/a.webp")
+    assert client.index.least_recently_used_locally("index/") == [
+        ("index/a.webp", len(b"digest"))
+    ]
+
+
+async def test_get_file_streams_and_touches(client):
+    client.index.add("content/abc", 3, created=1)
+    client.index.conn.execute(
+        "UPDATE objects SET last_access = 1 WHERE key = 'content/abc'"
+    )
+    client.stubber.add_response(
+        "get_object",
+        {"Body": io.BytesIO(b"abc")},
+        {"Bucket": "shots", "Key": "content/abc"},
+    )
+
+    stream = await client.get_file("content/abc")
+
+    assert b"".join([chunk async for chunk in stream]) == b"abc"
+    last_access = client.index.conn.execute(
+        "SELECT last_access FROM objects WHERE key = 'content/abc'"
+    ).fetchone()[0]
+    assert last_access > 1
+
+
+async def test_missing_file_leaves_the_index(client):
+    client.index.add("content/gone", 3)
+    client.stubber.add_client_error(
+        "get_object", service_error_code="NoSuchKey", http_status_code=404
+    )
+
+    with pytest.raises(FileNotFoundError):
+        await client.get_file("content/gone")
+    assert not client.index.contains("content/gone")
@@ -0,0 +1,111 @@
+import asyncio
+
+from shot_scraper_api.scheduler import HostScheduler
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+class Renders:
+    """Renders that hold their slot until they are finished"""
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.started = []
+        self.running = []
+
+    async def render(self, host, client):
+        release = asyncio.Event()
+        async with self.scheduler.slot(host, client):
+            self.started.append(host)
+            self.running.append(release)
+            await release.wait()
+
+    def start(self, host, client="client"):
+        return asyncio.create_task(self.render(host, client))
+
+    async def finish_all(self):
+        """Finish the longest running render until none are left"""
+        await settle()
+        while self.running:
+            self.running.pop(0).set()
+            await settle()
+
+
+async def test_slots_are_shared_round_robin_across_hosts():
+    scheduler = HostScheduler(max_total=2, max_per_host=1)
+    renders = Renders(scheduler)
+    for host in ["slow", "slow", "slow", "b", "b", "c"]:
+        renders.start(host)
+    await settle()
+    assert renders.started == ["slow", "b"]
+    assert scheduler.running == 2
+    assert scheduler.waiting == 4
+
+    # slow queued first but does not get to run all of its renders first
+    await renders.finish_all()
+    assert renders.started == ["slow", "b", "slow", "b", "c", "slow"]
+    assert scheduler.running == 0
+    assert scheduler.waiting == 0
+
+
+async def test_per_host_limit():
+    scheduler = HostScheduler(max_total=8, max_per_host=2)
+    renders = Renders(scheduler)
+    for _ in range(3):
+        renders.start("a")
+    await settle()
+    assert renders.started == ["a", "a"]
+    assert scheduler.stats() == {"waiting": 1, "running": 2, "hosts": {"a": 2}}
+
+    await renders.finish_all()
+    assert renders.started == ["a", "a", "a"]
+
+
+async def test_fair_by_client():
+    scheduler = HostScheduler(max_total=1, max_per_host=8, fair_by="client")
+    renders = Renders(scheduler)
+    for client in ["noisy"] * 5 + ["quiet"]:
+        renders.start(f"{client}.example", client)
+
+    # quiet waits for one more noisy render, not for all of them
+    await renders.finish_all()
+    assert renders.started.index("quiet.example") == 2
+    assert len(renders.started) == 6
+
+
+async def test_cancelled_waiter_leaves_the_queue():
+    scheduler = HostScheduler(max_total=1, max_per_host=1)
+    renders = Renders(scheduler)
+    renders.start("a")
+    waiting = renders.start("b")
+    await settle()
+    assert scheduler.waiting == 1
+
+    waiting.cancel()
+    await settle()
+    assert waiting.cancelled()
+    assert scheduler.waiting == 0
+
+    await renders.finish_all()
+    assert renders.started == ["a"]
+    assert scheduler.running == 0
+
+
+async def test_cancelled_render_frees_its_slot():
+    scheduler = HostScheduler(max_total=1, max_per_host=1)
+    renders = Renders(scheduler)
+    running = renders.start("a")
+    renders.start("b")
+    await settle()
+
+    running.cancel()
+    await settle()
+    assert renders.started == ["a", "b"]
+    assert scheduler.stats()["hosts"] == {"b": 1}
+
+    renders.running.pop(0)
+    await renders.finish_all()
+    assert scheduler.running == 0